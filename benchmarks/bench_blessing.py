@@ -0,0 +1,66 @@
+"""
+Compare the blessing cost engine against a Monte Carlo reference.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_blessing [trials]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from utils import blessing_engine
+from utils.blessing_engine import UPGRADE_PATHS, cost_summary
+
+PRICE = 100
+
+
+def simulate(path_name, price, trials, rng):
+    # Plays the upgrade out attempt by attempt, the way the game does
+    path = UPGRADE_PATHS[path_name]
+    costs = np.empty(trials)
+    for trial in range(trials):
+        gauge = 0
+        attempts = 0
+        while True:
+            attempts += 1
+            if gauge >= path.blessing_needed or rng.random() < path.base_chance:
+                break
+            gauge += path.blessing_gained
+        costs[trial] = attempts * price
+    return costs
+
+
+def main():
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+
+    for path_name in UPGRADE_PATHS:
+        blessing_engine.attempt_distribution.cache_clear()
+        cost_summary.cache_clear()
+
+        start = time.perf_counter()
+        exact = cost_summary(path_name, PRICE)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cost_summary(path_name, PRICE)
+        warm = time.perf_counter() - start
+
+        start = time.perf_counter()
+        costs = simulate(path_name, PRICE, trials, rng)
+        monte_carlo = time.perf_counter() - start
+        p50, p90, p99 = np.percentile(costs, [50, 90, 99], method="higher")
+
+        print(f"{path_name} ({trials} Monte Carlo trials, price {PRICE})")
+        print(f"  expected  exact {exact.expected:10.2f}   simulated {costs.mean():10.2f}")
+        print(f"  P50       exact {exact.p50:10.2f}   simulated {p50:10.2f}")
+        print(f"  P90       exact {exact.p90:10.2f}   simulated {p90:10.2f}")
+        print(f"  P99       exact {exact.p99:10.2f}   simulated {p99:10.2f}")
+        print(f"  time      engine {cold * 1e3:.3f} ms cold, {warm * 1e6:.1f} us cached   Monte Carlo {monte_carlo * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,252 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
+import asyncio
+import contextvars
+import hashlib
 import os
 import logging
-
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', filename='bot_logs.txt', filemode='a')
-logger = logging.getLogger(__name__)
+import time
+from utils.database import db, DatabaseError
+from utils import migrations, command_sync
+from utils.telemetry import telemetry
+from utils.log_setup import setup_logging, log_context
 
 # Load environment variables from the specified .env file
 load_dotenv("token.env")
 
+# Setup logging, a background thread does all the file writes (see utils/log_setup.py)
+log_listener = setup_logging()
+logger = logging.getLogger(__name__)
+
 # Debugging: Print database environment variables to confirm they are loaded
 print("DB_HOST:", os.getenv("DB_HOST"))
 print("DB_USER:", os.getenv("DB_USER"))
 print("DB_PASSWORD:", os.getenv("DB_PASSWORD"))
 print("DB_NAME:", os.getenv("DB_NAME"))
 
+class InstrumentedTree(app_commands.CommandTree):
+    # Times every slash command from the moment the interaction arrives
+    async def _call(self, interaction):
+        kind = "autocomplete" if interaction.type is discord.InteractionType.autocomplete else "app_command"
+        with telemetry.track(kind) as span, log_context(command=(interaction.data or {}).get("name"), guild_id=interaction.guild_id):
+            try:
+                await super()._call(interaction)
+            finally:
+                command = interaction.command
+                span.name = command.qualified_name if command else (interaction.data or {}).get("name")
+
+class VoidlingBot(commands.Bot):
+    """
+    Bot that records latency histograms for prefix commands, slash commands
+    and event listeners, see utils/telemetry.py.
+
+    It also remembers the content hash of every cog file it loaded, so
+    !reload only reloads the files that changed. A cog can keep its
+    in-memory state across a reload by defining ``export_state()``, whose
+    result is passed to the new instance's ``import_state(state)`` before
+    its ``cog_load`` runs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.extension_hashes = {}  # extension -> sha256 of the file it was loaded from
+        self._handover = {}  # cog name -> exported state waiting for the new instance
+
+    async def add_cog(self, cog, **kwargs):
+        state = self._handover.pop(cog.qualified_name, None)
+        if state is not None and hasattr(cog, "import_state"):
+            cog.import_state(state)
+        await super().add_cog(cog, **kwargs)
+
+    async def setup_hook(self):
+        # Runs exactly once, after login and before connecting to the gateway
+        telemetry.instrument_http(self.http)
+
+        # Bring the database schema up to date before any cog touches it
+        try:
+            await migrations.migrate()
+        except DatabaseError as e:
+            logger.error(f"Database migration failed: {e}")
+            print(f"Database migration failed: {e}")
+
+        await self.load_extensions()
+
+        # Sync commands globally (for all servers the bot is in), only when they changed
+        try:
+            if await command_sync.sync_if_changed(self):
+                print("Commands synced globally.")
+            else:
+                print("Command tree unchanged, skipped sync.")
+        except Exception as e:
+            logger.error(f"Failed to sync commands: {e}")
+            print(f"Failed to sync commands: {e}")
+
+        # Debug: Print all registered commands
+        logger.info("Registered commands:")
+        print("Registered commands:")
+        for command in self.tree.get_commands():
+            logger.info(f"- {command.name}: {command.description}")
+            print(f"- {command.name}: {command.description}")
+
+    @staticmethod
+    def extension_names():
+        return [
+            f"cogs.{filename[:-3]}" for filename in sorted(os.listdir("./cogs"))
+            if filename.endswith(".py") and not filename.startswith("_") and not filename.startswith(".")
+        ]
+
+    @staticmethod
+    def extension_hash(extension):
+        with open(os.path.join("cogs", extension.split(".", 1)[1] + ".py"), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    async def load_extensions(self):
+        """
+        Load every cog concurrently and print how long each one took.
+
+        Imports still happen one at a time, but the cogs' async setup (mostly
+        warming caches from the database) overlaps.
+        """
+        async def load(extension):
+            start = time.perf_counter()
+            try:
+                digest = self.extension_hash(extension)
+                await self.load_extension(extension)
+                self.extension_hashes[extension] = digest
+                error = None
+            except Exception as e:
+                error = e
+            return extension, time.perf_counter() - start, error
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(load(extension) for extension in self.extension_names()))
+        total = time.perf_counter() - started
+
+        print("Startup report:")
+        for extension, elapsed, error in sorted(results, key=lambda result: result[1], reverse=True):
+            if error:
+                logger.error(f"Failed to load {extension}: {error}")
+                print(f"  {extension:<28} {elapsed * 1000:7.1f}ms  FAILED: {error}")
+            else:
+                logger.info(f"{extension} loaded in {elapsed * 1000:.1f}ms")
+                print(f"  {extension:<28} {elapsed * 1000:7.1f}ms")
+        loaded = sum(1 for result in results if result[2] is None)
+        logger.info(f"Loaded {loaded}/{len(results)} extensions in {total * 1000:.1f}ms")
+        print(f"Loaded {loaded}/{len(results)} extensions in {total * 1000:.1f}ms")
+
+    async def reload_changed(self):
+        """
+        Reload the cogs whose file changed since it was loaded, load new ones
+        and unload removed ones. Returns a list of (step, seconds, error).
+        """
+        steps = []
+
+        start = time.perf_counter()
+        current = {extension: self.extension_hash(extension) for extension in self.extension_names()}
+        steps.append((f"hash {len(current)} files", time.perf_counter() - start, None))
+
+        # Cogs start their background tasks while loading, and a task copies the context it is
+        # created in. A blank one keeps !reload's log context and telemetry span out of them.
+        steps += await contextvars.Context().run(asyncio.ensure_future, self.apply_changes(current))
+
+        if len(steps) > 1:
+            start = time.perf_counter()
+            try:
+                synced = await command_sync.sync_if_changed(self, once=False)
+                error = None
+            except Exception as e:
+                synced, error = False, e
+            steps.append(("sync commands" if synced else "command tree unchanged", time.perf_counter() - start, error))
+        return steps
+
+    async def apply_changes(self, current):
+        """Unload, reload and load extensions against the ``current`` file hashes."""
+        steps = []
+        removed = [extension for extension in self.extensions if extension.startswith("cogs.") and extension not in current]
+        for extension in removed:
+            start = time.perf_counter()
+            try:
+                await self.unload_extension(extension)
+                self.extension_hashes.pop(extension, None)
+                error = None
+            except Exception as e:
+                error = e
+            steps.append((f"unload {extension}", time.perf_counter() - start, error))
+
+        for extension, digest in current.items():
+            if extension in self.extensions and self.extension_hashes.get(extension) == digest:
+                continue
+            start = time.perf_counter()
+            # Decided up front so a failing export_state is reported against the right step
+            action = "reload" if extension in self.extensions else "load"
+            try:
+                if action == "reload":
+                    # Collect the old cogs' state first, the new instances pick it up in add_cog
+                    for cog in self.cogs.values():
+                        if type(cog).__module__ == extension and hasattr(cog, "export_state"):
+                            self._handover[cog.qualified_name] = cog.export_state()
+                    # Rolls back to the old module if the new one fails to load
+                    await self.reload_extension(extension)
+                else:
+                    await self.load_extension(extension)
+                self.extension_hashes[extension] = digest
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                self._handover.clear()
+            steps.append((f"{action} {extension}", time.perf_counter() - start, error))
+        return steps
+
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            await super().invoke(ctx)
+            return
+        with telemetry.track("command", ctx.command.qualified_name), \
+                log_context(command=ctx.command.qualified_name, guild_id=ctx.guild.id if ctx.guild else None):
+            await super().invoke(ctx)
+
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        # Named after the listener so two cogs handling the same event are told apart
+        with telemetry.track("event", getattr(coro, "__qualname__", event_name)):
+            await super()._run_event(coro, event_name, *args, **kwargs)
+
 # Bot setup
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Privileged: needed for join/leave events and the member lists the roster cleanup checks against
+intents.members = True
+bot = VoidlingBot(command_prefix="!", intents=intents, owner_id=139769063948681217, tree_cls=InstrumentedTree)
 
-# Log when bot is ready
+# Log when bot is ready, this fires again after every reconnect so it only logs
 @bot.event
 async def on_ready():
     logger.info(f"Logged in as {bot.user.name} - {bot.user.id}")
     print(f"Logged in as {bot.user}")
 
-    # Load the cogs
-    for filename in os.listdir("./cogs"):
-        if filename.endswith(".py") and not filename.startswith("_") and not filename.startswith("."):
-            try:
-                await bot.load_extension(f"cogs.{filename[:-3]}")
-                logger.info(f"{filename} loaded successfully.")
-                print(f"{filename} loaded successfully.")
-            except Exception as e:
-                logger.error(f"Failed to load {filename}: {e}")
-                print(f"Failed to load {filename}: {e}")
-
-    # Sync commands globally (for all servers the bot is in)
-    try:
-        await bot.tree.sync()
-        logger.info("Commands synced globally.")
-        print("Commands synced globally.")
-    except Exception as e:
-        logger.error(f"Failed to sync commands: {e}")
-        print(f"Failed to sync commands: {e}")
-
-    # Debug: Print all registered commands
-    logger.info("Registered commands:")
-    print("Registered commands:")
-    for command in bot.tree.get_commands():
-        logger.info(f"- {command.name}: {command.description}")
-        print(f"- {command.name}: {command.description}")
-
-# Reload command to reload all cogs, and load new ones if they are not loaded
+# Reload command to reload the cogs that changed, and load new ones if they are not loaded
 @bot.command()
 async def reload(ctx):
-    if ctx.author.id != 139769063948681217:
+    if ctx.author.id != bot.owner_id:
         await ctx.send("You do not have permission to use this command.")
         return
-    try:
-        for filename in os.listdir("./cogs"):
-            if filename.endswith(".py") and not filename.startswith("_") and not filename.startswith("."):
-                extension = f"cogs.{filename[:-3]}"
-                if extension in bot.extensions:
-                    await bot.unload_extension(extension)
-                await bot.load_extension(extension)
-        await ctx.send("Reloaded all extensions, including any new ones.")
-        logger.info("Reloaded all extensions, including any new ones.")
-    except Exception as e:
-        await ctx.send(f"Error reloading extensions: {e}")
-        logger.error(f"Error reloading extensions: {e}")
+    started = time.perf_counter()
+    steps = await bot.reload_changed()
+    total = time.perf_counter() - started
+
+    lines = []
+    for step, elapsed, error in steps:
+        lines.append(f"{step:<40} {elapsed * 1000:8.1f}ms" + (f"  FAILED: {error}" if error else ""))
+        if error:
+            logger.error(f"Reload step '{step}' failed: {error}")
+    if len(steps) == 1:
+        lines.append("No cogs changed.")
+    lines.append(f"{'total':<40} {total * 1000:8.1f}ms")
+    await ctx.send("```\n" + "\n".join(lines) + "\n```")
+    logger.info(f"Reloaded changed extensions in {total * 1000:.1f}ms")
 
 # Log all command invocations
 @bot.event
@@ -85,5 +258,11 @@ async def on_command(ctx):
 async def on_command_error(ctx, error):
     logger.error(f"Error in command '{ctx.command}': {error}")
 
-# Run the bot using the token from .env file
-bot.run(os.getenv("DISCORD_BOT_TOKEN"))
\ No newline at end of file
+# Run the bot using the token from .env file. log_handler=None keeps discord.py from adding
+# its own stderr handler, its records go through the same queue as ours
+bot.run(os.getenv("DISCORD_BOT_TOKEN"), log_handler=None)
+
+# Let in-flight queries finish before the process exits
+db.close()
+# Write out whatever is still queued
+log_listener.stop()
\ No newline at end of file
@@ -1,140 +1,232 @@
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
-from datetime import datetime, timedelta
-import pytz
-import os
-import mysql.connector
-from mysql.connector import Error
-
-# Database connection configuration using environment variables
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+from utils.database import DatabaseError
+from utils.guild_settings import guild_settings, DEFAULT_LEAD_MINUTES
+from utils.scheduler import EventScheduler
+from utils.fanout import Delivery, FanoutDispatcher
+from utils.boss_timeline import timeline, archboss_cycle
+from utils.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+BOSS_TYPES = ("Normal Boss", "Archboss")
 
 class BossReminderCog(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, clock=None):
         self.bot = bot
-        self.tz = pytz.timezone('UTC')  # Setting timezone to Europe/Berlin
-        self.reminders_sent = {}  # Track sent reminders per guild and boss type
-        self.boss_reminder_task.start()
+        self.tz = timezone.utc
+        # One pending reminder per (guild_id, boss_type), ordered by when it has to go out
+        self.scheduler = EventScheduler(clock) if clock else EventScheduler()
+        self.reminder_task = None
+        # Reminders due at the same moment go out concurrently instead of one guild after another
+        self.dispatcher = FanoutDispatcher(max_concurrency=10)
+        self.dispatch_tasks = set()
+        # Settings each guild's pending reminders were computed from, and the settings load they match
+        self.scheduled = {}
+        self.synced_generation = 0
+        # (guild_id, boss_type) -> spawn time of the last reminder that went out, never reminded twice
+        self.reminded = {}
+
+    def export_state(self):
+        # Keeping the pending reminders means one that already went out for a spawn isn't sent again
+        return {
+            "scheduler": self.scheduler,
+            "dispatcher": self.dispatcher,
+            "scheduled": self.scheduled,
+            "synced_generation": self.synced_generation,
+            "reminded": self.reminded,
+        }
+
+    def import_state(self, state):
+        self.scheduler = state["scheduler"]
+        self.dispatcher = state["dispatcher"]
+        self.scheduled = state.get("scheduled", {})
+        self.synced_generation = state.get("synced_generation", 0)
+        self.reminded = state.get("reminded", {})
+
+    async def cog_load(self):
+        # One bulk query up front, after that the reminder loop is served from memory
+        await guild_settings.warm()
+        self.start_reminder_task()
+        self.resync_schedule.start()
+
+    def start_reminder_task(self):
+        self.reminder_task = asyncio.create_task(self.boss_reminder_task())
+        self.reminder_task.add_done_callback(self.reminder_task_done)
+
+    def reminder_task_done(self, task):
+        # Anything escaping the loop would otherwise end every reminder without a trace
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error("Boss reminder loop crashed, restarting it", exc_info=task.exception())
+        self.start_reminder_task()
 
     def cog_unload(self):
-        self.boss_reminder_task.cancel()
+        if self.reminder_task:
+            self.reminder_task.cancel()
+        self.resync_schedule.cancel()
+        for task in self.dispatch_tasks:
+            task.cancel()
+
+    def schedule_guild(self, guild_id, settings, after=None):
+        """
+        Queue the next reminder of each boss type for a guild, replacing any pending ones.
+        """
+        for boss_type in BOSS_TYPES:
+            self.schedule_reminder(guild_id, boss_type, settings, after)
+        self.scheduled[guild_id] = settings
+
+    def unschedule_guild(self, guild_id):
+        self.scheduler.cancel_where(lambda key: key[0] == guild_id)
+        self.scheduled.pop(guild_id, None)
+
+    def sync_schedule(self, settings_by_guild):
+        """
+        Bring the pending reminders in line with the settings: guilds that are new or changed
+        are (re)scheduled and guilds whose settings are gone are dropped.
+        """
+        for guild in self.bot.guilds:
+            settings = settings_by_guild.get(guild.id)
+            if not settings:
+                if guild.id in self.scheduled or (guild.id, BOSS_TYPES[0]) in self.scheduler:
+                    self.unschedule_guild(guild.id)
+            elif guild.id not in self.scheduled and (guild.id, BOSS_TYPES[0]) in self.scheduler:
+                # Pending reminders handed over without their settings, rescheduling could repeat one
+                self.scheduled[guild.id] = settings
+            elif settings != self.scheduled.get(guild.id):
+                self.schedule_guild(guild.id, settings)
+
+    def schedule_reminder(self, guild_id, boss_type, settings, after=None):
+        now = datetime.fromtimestamp(self.scheduler.clock(), self.tz)
+        after = after or now
+        # Rescheduling inside the lead window must not go back to a spawn that was already reminded
+        reminded = self.reminded.get((guild_id, boss_type))
+        if reminded and reminded > after:
+            after = reminded
+        spawn_time = timeline.next_event(after, kind=boss_type).time
+        lead = timedelta(minutes=settings.get("lead_minutes") or DEFAULT_LEAD_MINUTES)
+        # If we are already inside the lead window (e.g. right after startup) remind straight away
+        fire_at = max(spawn_time - lead, now)
+        self.scheduler.schedule((guild_id, boss_type), fire_at.timestamp(), spawn_time)
+
+    @tasks.loop(seconds=30)
+    async def resync_schedule(self):
+        # Retries a failed load and triggers the TTL reload, either one bumps the generation
+        await guild_settings.ensure_loaded()
+        if guild_settings.loaded and guild_settings.generation != self.synced_generation:
+            self.sync_schedule(await guild_settings.get_all())
+            self.synced_generation = guild_settings.generation
+
+    @resync_schedule.before_loop
+    async def before_resync_schedule(self):
+        await self.bot.wait_until_ready()
 
-    def get_guild_settings(self, guild_id):
-        try:
-            connection = mysql.connector.connect(**DB_CONFIG)
-            if connection.is_connected():
-                cursor = connection.cursor(dictionary=True)
-                cursor.execute("SELECT channel_id, role_id FROM guild_settings WHERE guild_id = %s", (guild_id,))
-                result = cursor.fetchone()
-                return result
-        except Error as e:
-            print(f"[ERROR] Database connection failed: {e}")
-        finally:
-            if connection.is_connected():
-                connection.close()
-        return None
-
-    def get_next_boss_time(self):
-        now = datetime.now(self.tz)
-        daily_spawn_times = [12, 15, 19, 21, 0]  # Original spawn times for normal bosses
-        for hour in daily_spawn_times:
-            boss_time = now.replace(hour=hour, minute=0, second=0, microsecond=0)
-            if boss_time > now:
-                return boss_time, "Normal Boss"
-        next_day = now + timedelta(days=1)
-        next_boss_time = next_day.replace(hour=0, minute=0, second=0, microsecond=0)
-        return next_boss_time, "Normal Boss"
-
-    def get_next_archboss_time(self):
-        now = datetime.now(self.tz)
-        next_wednesday = now + timedelta((2 - now.weekday()) % 7)
-        next_saturday = now + timedelta((5 - now.weekday()) % 7)
-        archboss_times = [
-            next_wednesday.replace(hour=19, minute=0, second=0, microsecond=0),
-            next_saturday.replace(hour=19, minute=0, second=0, microsecond=0)
-        ]
-        for archboss_time in archboss_times:
-            if archboss_time > now:
-                return archboss_time, "Archboss"
-        next_week_wednesday = next_wednesday + timedelta(weeks=1)
-        return next_week_wednesday.replace(hour=19, minute=0, second=0, microsecond=0), "Archboss"
-
-    @tasks.loop(minutes=1)
     async def boss_reminder_task(self):
-        now = datetime.now(self.tz)
-        next_boss_time, boss_type = self.get_next_boss_time()
-        next_archboss_time, archboss_type = self.get_next_archboss_time()
-
-        for guild in self.bot.guilds:
-            guild_settings = self.get_guild_settings(guild.id)
-
-            # Skip if the guild hasn't set up the channel and role in the database
-            if not guild_settings:
-                continue
-
-            channel_id = guild_settings.get("channel_id")
-            role_id = guild_settings.get("role_id")
-            
-            channel = guild.get_channel(channel_id) if channel_id else None
-            role = guild.get_role(role_id) if role_id else None
-
-            if guild.id not in self.reminders_sent:
-                self.reminders_sent[guild.id] = {"Normal Boss": False, "Archboss": False}
-
-            # Normal Boss Reminder
-            if (next_boss_time - now).total_seconds() <= 900:  # 15 minutes before the spawn
-                if not self.reminders_sent[guild.id]["Normal Boss"]:
-                    self.reminders_sent[guild.id]["Normal Boss"] = True
-                    if channel:
-                        try:
-                            await channel.send(f"{role.mention if role else ''} Reminder: A **{boss_type}** will spawn in 15 minutes at <t:{int(next_boss_time.timestamp())}:t>.")
-                        except discord.Forbidden:
-                            print(f"[ERROR] Missing access to channel {channel.id} in guild {guild.id}.")
-                        except discord.HTTPException as e:
-                            print(f"[ERROR] Failed to send message in guild {guild.id}: {e}")
-            else:
-                self.reminders_sent[guild.id]["Normal Boss"] = False
-
-            # Archboss Reminder
-            if (next_archboss_time - now).total_seconds() <= 900:  # 15 minutes before the spawn
-                if not self.reminders_sent[guild.id]["Archboss"]:
-                    self.reminders_sent[guild.id]["Archboss"] = True
-                    if channel:
-                        try:
-                            await channel.send(f"{role.mention if role else ''} Reminder: An **{archboss_type}** will spawn in 15 minutes at <t:{int(next_archboss_time.timestamp())}:t>.")
-                        except discord.Forbidden:
-                            print(f"[ERROR] Missing access to channel {channel.id} in guild {guild.id}.")
-                        except discord.HTTPException as e:
-                            print(f"[ERROR] Failed to send message in guild {guild.id}: {e}")
-            else:
-                self.reminders_sent[guild.id]["Archboss"] = False
-
-    @boss_reminder_task.before_loop
-    async def before_boss_reminder_task(self):
+        # Guilds are scheduled by resync_schedule, this only waits for and sends what is due
         await self.bot.wait_until_ready()
+        while True:
+            # Sleeps until the earliest reminder is due, no polling in between
+            deliveries = []
+            for event in await self.scheduler.wait_due():
+                try:
+                    delivery = await self.prepare_reminder(event)
+                except Exception:
+                    # One broken guild mustn't hold up the reminders of the others
+                    logger.exception(f"Failed to prepare the {event.key[1]} reminder for guild {event.key[0]}")
+                    continue
+                if delivery:
+                    deliveries.append(delivery)
+
+            # Send in the background so a slow channel can't delay the next batch
+            task = asyncio.create_task(self.send_reminders(deliveries))
+            self.dispatch_tasks.add(task)
+            task.add_done_callback(self.dispatch_tasks.discard)
+
+    async def prepare_reminder(self, event):
+        guild_id, boss_type = event.key
+        spawn_time = event.payload
+        self.reminded[event.key] = spawn_time
+        settings = await guild_settings.get(guild_id)
+        guild = self.bot.get_guild(guild_id)
+
+        # Skip if the guild hasn't set up the channel and role in the database
+        if not settings or not guild:
+            return None
+
+        # Queue the following spawn of the same type first, so a failure below doesn't end the guild's reminders
+        self.schedule_reminder(guild_id, boss_type, settings, after=spawn_time)
+        return self.build_reminder(guild, settings, boss_type, spawn_time, event.fire_at)
+
+    @telemetry.timed("task")
+    async def send_reminders(self, deliveries):
+        await self.dispatcher.dispatch(deliveries)
+
+    def build_reminder(self, guild, settings, boss_type, spawn_time, scheduled_at):
+        channel_id = settings.get("channel_id")
+        role_id = settings.get("role_id")
+
+        channel = guild.get_channel(channel_id) if channel_id else None
+        role = guild.get_role(role_id) if role_id else None
+        if not channel:
+            return None
+
+        if boss_type == "Archboss":
+            boss_name = f"An **Archboss** ({archboss_cycle.state_at(spawn_time)})"
+        else:
+            boss_name = f"A **{boss_type}**"
+        minutes = max(1, round((spawn_time.timestamp() - self.scheduler.clock()) / 60))
+        content = f"{role.mention if role else ''} Reminder: {boss_name} will spawn in {minutes} minutes at <t:{int(spawn_time.timestamp())}:t>."
+
+        async def send():
+            await channel.send(content)
+
+        # Messages to one channel share a rate-limit bucket, failures are logged by the dispatcher
+        return Delivery(guild.id, channel.id, scheduled_at, send)
+
+    @commands.command(name="reminderlag")
+    @commands.is_owner()
+    async def reminderlag(self, ctx):
+        """
+        Show how late boss reminders were delivered per guild (bot owner only).
+        """
+        summary = self.dispatcher.latency_summary()
+        if not summary:
+            await ctx.send("No reminders have been delivered yet.")
+            return
+        lines = []
+        for guild_id, last_delay, worst_delay in summary[:15]:
+            guild = self.bot.get_guild(guild_id)
+            name = guild.name if guild else guild_id
+            lines.append(f"{name}: last {last_delay:.2f}s, worst {worst_delay:.2f}s")
+        await ctx.send("**Reminder delivery delay (scheduled vs sent)**\n" + "\n".join(lines))
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.unschedule_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        # The bot may be re-added to a guild that still has its settings
+        settings = await guild_settings.get(guild.id)
+        if settings:
+            self.schedule_guild(guild.id, settings)
 
     @app_commands.command(name="set_boss_channel", description="Set the channel and role for boss reminders.")
-    async def set_boss_channel(self, interaction: discord.Interaction, channel: discord.TextChannel, role: discord.Role):
+    @app_commands.describe(lead_minutes="How many minutes before a spawn the reminder is posted (default 15).")
+    async def set_boss_channel(self, interaction: discord.Interaction, channel: discord.TextChannel, role: discord.Role,
+                               lead_minutes: app_commands.Range[int, 1, 120] = DEFAULT_LEAD_MINUTES):
         try:
-            connection = mysql.connector.connect(**DB_CONFIG)
-            if connection.is_connected():
-                cursor = connection.cursor()
-                cursor.execute("REPLACE INTO guild_settings (guild_id, channel_id, role_id) VALUES (%s, %s, %s)",
-                               (interaction.guild.id, channel.id, role.id))
-                connection.commit()
-                await interaction.response.send_message(f"Boss reminder channel set to {channel.mention} with role {role.mention}.")
-        except Error as e:
-            print(f"[ERROR] Database connection failed: {e}")
+            await guild_settings.set(interaction.guild.id, channel.id, role.id, lead_minutes)
+        except DatabaseError as e:
+            print(f"[ERROR] Database query failed: {e}")
             await interaction.response.send_message("Failed to set the boss reminder channel due to a database error.", ephemeral=True)
-        finally:
-            if connection.is_connected():
-                connection.close()
+            return
+        self.schedule_guild(interaction.guild.id, await guild_settings.get(interaction.guild.id))
+        await interaction.response.send_message(f"Boss reminder channel set to {channel.mention} with role {role.mention}, reminders go out {lead_minutes} minutes before each spawn.")
 
 async def setup(bot):
-    await bot.add_cog(BossReminderCog(bot))
\ No newline at end of file
+    await bot.add_cog(BossReminderCog(bot))
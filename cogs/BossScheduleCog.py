@@ -1,133 +1,62 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from datetime import datetime, timedelta
-import pytz
-import os
-import mysql.connector
-from mysql.connector import Error
-
-# Database connection configuration using environment variables
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
+from datetime import datetime, timezone
+import asyncio
+from typing import Literal
+from utils.database import DatabaseError
+from utils.repositories import archboss_repo
+from utils.guild_settings import guild_settings
+from utils.boss_timeline import timeline, archboss_cycle
 
 class BossScheduleCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.boss_times = [
-            (13, "2 Peace Boss, 1 Conflict Boss"),
-            (16, "2 Peace Boss, 1 Conflict Boss"),
-            (20, "4 Peace Boss, 3 Conflict Boss"),
-            (22, "3 Peace Boss, 2 Conflict Boss"),
-            (1, "2 Peace Boss, 2 Conflict Boss")
-        ]
-        self.tz = pytz.timezone('Europe/Berlin')
-        self.archboss_cycle_state = self.load_archboss_cycle_state()
+        self.anchor_task = None
 
-    def load_archboss_cycle_state(self):
-        # Retrieve the current active cycle state with status=1
-        try:
-            connection = mysql.connector.connect(**DB_CONFIG)
-            if connection.is_connected():
-                cursor = connection.cursor(dictionary=True)
-                cursor.execute("SELECT cycle_state FROM archboss_cycle WHERE status = 1 LIMIT 1")
-                result = cursor.fetchone()
-                if result:
-                    return result['cycle_state']
-                # If no active cycle is found, set the first row as active (Conflict by default)
-                cursor.execute("UPDATE archboss_cycle SET status = 1 WHERE id = 1")
-                connection.commit()
-                return "Conflict"  # Default to Conflict if no status is active
-        except Error as e:
-            print(f"Error while loading archboss cycle state: {e}")
-        finally:
-            if connection.is_connected():
-                connection.close()
-        return "Conflict"
+    async def cog_load(self):
+        # The rotation works from the built-in default straight away, the one stored in
+        # the database is picked up in the background
+        self.anchor_task = asyncio.create_task(self.load_archboss_anchor())
 
-    def update_archboss_cycle_state(self, next_archboss_time):
-        # Shift the active cycle to the next row after each Archboss event
-        now = datetime.now(self.tz)
-        if now >= next_archboss_time:
-            try:
-                connection = mysql.connector.connect(**DB_CONFIG)
-                if connection.is_connected():
-                    cursor = connection.cursor(dictionary=True)
-                    # Find the current active row
-                    cursor.execute("SELECT id FROM archboss_cycle WHERE status = 1 LIMIT 1")
-                    current_row = cursor.fetchone()
-                    
-                    if current_row:
-                        current_id = current_row['id']
-                        next_id = current_id + 1 if current_id < 4 else 1  # Wrap around to the first row
-                        # Update the cycle state
-                        cursor.execute("UPDATE archboss_cycle SET status = 0 WHERE id = %s", (current_id,))
-                        cursor.execute("UPDATE archboss_cycle SET status = 1 WHERE id = %s", (next_id,))
-                        connection.commit()
-                        # Load the new cycle state
-                        cursor.execute("SELECT cycle_state FROM archboss_cycle WHERE id = %s", (next_id,))
-                        new_cycle = cursor.fetchone()
-                        self.archboss_cycle_state = new_cycle['cycle_state'] if new_cycle else "Conflict"
-            except Error as e:
-                print(f"Error while updating archboss cycle state: {e}")
-            finally:
-                if connection.is_connected():
-                    connection.close()
+    def cog_unload(self):
+        if self.anchor_task:
+            self.anchor_task.cancel()
 
-    def get_guild_settings(self, guild_id):
-        # Retrieve guild settings from the database
+    async def load_archboss_anchor(self):
         try:
-            connection = mysql.connector.connect(**DB_CONFIG)
-            if connection.is_connected():
-                cursor = connection.cursor(dictionary=True)
-                cursor.execute("SELECT channel_id, role_id FROM guild_settings WHERE guild_id = %s", (guild_id,))
-                result = cursor.fetchone()
-                return result
-        except Error as e:
-            print(f"Error while connecting to MySQL: {e}")
-        finally:
-            if connection.is_connected():
-                connection.close()
-        return None
+            cycle = await archboss_repo.cycle()
+            result = await archboss_repo.load()
+        except DatabaseError as e:
+            # The database is unreachable: keep the default
+            print(f"No archboss rotation loaded: {e}")
+            return
+        if cycle:
+            archboss_cycle.set_cycle(cycle)
+        if result:
+            anchor_timestamp, state, position = result
+            try:
+                archboss_cycle.set_anchor(datetime.fromtimestamp(anchor_timestamp, timezone.utc), state, position)
+            except ValueError as e:
+                print(f"Ignoring stored archboss anchor: {e}")
+
+    async def save_archboss_anchor(self, anchor_time, state, position):
+        await archboss_repo.save(int(anchor_time.timestamp()), state, position)
 
     def get_next_boss_info(self):
-        now = datetime.now(self.tz)
-        for hour, info in self.boss_times:
-            boss_time = now.replace(hour=hour, minute=0, second=0, microsecond=0)
-            if boss_time > now:
-                return boss_time, info
-        # If no boss time is found today, return the midnight boss time tomorrow if it exists
-        next_day = now + timedelta(days=1)
-        midnight_boss = next((time for time in self.boss_times if time[0] == 0), None)
-        if midnight_boss:
-            return next_day.replace(hour=0, minute=0, second=0, microsecond=0), midnight_boss[1]
-        # Otherwise, return the first boss time of the day
-        return next_day.replace(hour=self.boss_times[0][0], minute=0, second=0, microsecond=0), self.boss_times[0][1]
+        # Spawn times come from the shared timeline, the same one the reminders use
+        event = timeline.next_event(kind="Normal Boss")
+        return event.time, event.info
 
     def get_next_archboss_info(self):
-        now = datetime.now(self.tz)
-        # Find the next Wednesday or Saturday
-        next_wednesday = now + timedelta((2 - now.weekday()) % 7)
-        next_saturday = now + timedelta((5 - now.weekday()) % 7)
-        
-        # Determine which is sooner and set the time to 20:00
-        if next_wednesday < next_saturday:
-            next_archboss_date = next_wednesday
-        else:
-            next_archboss_date = next_saturday
-        
-        next_archboss_time = next_archboss_date.replace(hour=20, minute=0, second=0, microsecond=0)
-        return next_archboss_time, self.archboss_cycle_state
+        event = timeline.next_event(kind="Archboss")
+        return event.time, archboss_cycle.state_at(event.time)
 
     @app_commands.command(name="boss_schedule", description="Displays the upcoming boss spawn schedule.")
     async def boss_schedule(self, interaction: discord.Interaction):
         next_boss_time, next_boss_info = self.get_next_boss_info()
         next_archboss_time, next_archboss_info = self.get_next_archboss_info()
-        settings = self.get_guild_settings(interaction.guild.id)
+        settings = await guild_settings.get(interaction.guild.id)
         role_mention = f"<@&{settings['role_id']}>" if settings else "No role set"
 
         # Embed formatting with corrected newlines
@@ -168,5 +97,35 @@ class BossScheduleCog(commands.Cog):
         if reaction and reaction.me:
             await reaction.remove(self.bot.user)
 
+    @app_commands.command(name="set_archboss_cycle", description="Correct whether the next Archboss is Peace or Conflict.")
+    @app_commands.describe(state="The state of the next Archboss spawn.")
+    # The rotation is shared by every server the bot is in, so no single server's admin may change it
+    @app_commands.check(lambda interaction: interaction.user.id == interaction.client.owner_id)
+    async def set_archboss_cycle(self, interaction: discord.Interaction, state: Literal["Conflict", "Peace"]):
+        next_archboss = timeline.next_event(kind="Archboss")
+        if state not in archboss_cycle.cycle:
+            await interaction.response.send_message(f"**{state}** is not part of the Archboss rotation.", ephemeral=True)
+            return
+        # Keep the current step if it already matches, otherwise jump to the first step with that state
+        position = archboss_cycle.position_at(next_archboss.time)
+        if archboss_cycle.cycle[position] != state:
+            position = archboss_cycle.cycle.index(state)
+        try:
+            await self.save_archboss_anchor(next_archboss.time, state, position)
+        except DatabaseError as e:
+            print(f"Error while saving archboss anchor: {e}")
+            await interaction.response.send_message("Failed to save the Archboss cycle due to a database error.", ephemeral=True)
+            return
+        archboss_cycle.set_anchor(next_archboss.time, state, position)
+        await interaction.response.send_message(
+            f"The next Archboss at <t:{int(next_archboss.time.timestamp())}:f> is now set to **{state}**, later ones follow the rotation from there.",
+            ephemeral=True
+        )
+
+    @set_archboss_cycle.error
+    async def set_archboss_cycle_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            await interaction.response.send_message("You do not have permission to use this command. Only the bot owner can change the Archboss cycle.", ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(BossScheduleCog(bot))
\ No newline at end of file
@@ -1,38 +1,21 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import mysql.connector
-import os
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
+from utils.guild_settings import guild_settings
 
 class BossTimerRoleCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    def get_role_id(self, guild_id):
-        # Connect to the MySQL database to retrieve the role ID
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor()
-        
-        query = "SELECT role_id FROM guild_settings WHERE guild_id = %s"
-        cursor.execute(query, (guild_id,))
-        result = cursor.fetchone()
-        
-        cursor.close()
-        connection.close()
-        
-        return int(result[0]) if result else None
+    async def get_role_id(self, guild_id):
+        # Served from the shared guild settings cache
+        settings = await guild_settings.get(guild_id)
+        return int(settings["role_id"]) if settings and settings["role_id"] else None
 
     @app_commands.command(name="subscribe", description="Subscribe to the Boss Timer role")
     async def subscribe(self, interaction: discord.Interaction):
         # Fetch the role ID for the server from the database
-        role_id = self.get_role_id(interaction.guild.id)
+        role_id = await self.get_role_id(interaction.guild.id)
         if not role_id:
             await interaction.response.send_message("Boss Timer role not set up in this server.", ephemeral=True)
             return
@@ -58,7 +41,7 @@ class BossTimerRoleCog(commands.Cog):
     @app_commands.command(name="unsubscribe", description="Unsubscribe from the Boss Timer role")
     async def unsubscribe(self, interaction: discord.Interaction):
         # Fetch the role ID for the server from the database
-        role_id = self.get_role_id(interaction.guild.id)
+        role_id = await self.get_role_id(interaction.guild.id)
         if not role_id:
             await interaction.response.send_message("Boss Timer role not set up in this server.", ephemeral=True)
             return
@@ -1,9 +1,40 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-import asyncio
+import logging
 from collections import Counter
-import string
+from utils.database import DatabaseError
+from utils.repositories import vote_repo
+
+logger = logging.getLogger(__name__)
+
+# Vote posts older than this are not preloaded, results still find them in the database
+PRELOAD_DAYS = 30
+
+class WeeklyBossVoteView(discord.ui.View):
+    """
+    Persistent voting controls attached to every weekly boss post.
+
+    The custom IDs are fixed, so a single registered instance handles clicks
+    on every vote post, including ones made before the bot restarted.
+    """
+
+    def __init__(self, cog):
+        super().__init__(timeout=None)
+        self.cog = cog
+        self.boss_select.options = [
+            discord.SelectOption(label=boss, value=boss, emoji=cog.emoji_list[i])
+            for i, boss in enumerate(cog.bosses)
+        ]
+        self.boss_select.max_values = len(cog.bosses)
+
+    @discord.ui.select(placeholder="Choose the bosses you want to fight", min_values=1, custom_id="weekly_boss_vote:select")
+    async def boss_select(self, interaction: discord.Interaction, select: discord.ui.Select):
+        await self.cog.record_vote(interaction, set(select.values))
+
+    @discord.ui.button(label="Clear my vote", style=discord.ButtonStyle.secondary, custom_id="weekly_boss_vote:clear")
+    async def clear_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.cog.record_vote(interaction, set())
 
 class WeeklyGuildBoss(commands.Cog):
     def __init__(self, bot):
@@ -24,26 +55,108 @@ class WeeklyGuildBoss(commands.Cog):
             "Nirma",
             "Aridus"
         ]
-        self.votes = Counter()
         self.emoji_list = [
             "1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟",
             "🆔", "🆒", "🆕", "🆓", "🆗"
         ]
+        # message_id -> {user_id: set of bosses}, one entry per vote post
+        self.votes = {}
+        self.post_guilds = {}  # message_id -> guild the post was made in
+        self.view = WeeklyBossVoteView(self)
+        self.restored = False
+
+    def export_state(self):
+        return {"votes": self.votes, "post_guilds": self.post_guilds}
+
+    def import_state(self, state):
+        # Older state has no post_guilds, see Drops.import_state
+        if "post_guilds" not in state:
+            return
+        self.votes = state["votes"]
+        self.post_guilds = state["post_guilds"]
+        self.restored = True
+
+    async def cog_load(self):
+        self.bot.add_view(self.view)
+        if self.restored:
+            return
+        try:
+            posts, votes = await vote_repo.recent_boss_posts(PRELOAD_DAYS)
+        except DatabaseError as e:
+            logger.error(f"Failed to load weekly boss votes: {e}")
+            return
+        for post in posts:
+            self.votes[post['message_id']] = {}
+            self.post_guilds[post['message_id']] = post['guild_id']
+        for vote in votes:
+            self.votes[vote['message_id']].setdefault(vote['user_id'], set()).add(vote['boss'])
+
+    def cog_unload(self):
+        self.view.stop()
+
+    async def load_post(self, message_id):
+        """Load a vote post that wasn't preloaded. Returns False if it isn't a vote post."""
+        post = await vote_repo.boss_post(message_id)
+        if post is None:
+            return False
+        guild_id, votes = post
+        ballots = {}
+        for vote in votes:
+            ballots.setdefault(vote['user_id'], set()).add(vote['boss'])
+        self.votes[message_id] = ballots
+        self.post_guilds[message_id] = guild_id
+        return True
+
+    async def record_vote(self, interaction: discord.Interaction, bosses):
+        """
+        Replace the user's ballot on the vote post the interaction came from.
+        """
+        message_id = interaction.message.id
+        user_id = interaction.user.id
+        if message_id not in self.votes:
+            try:
+                found = await self.load_post(message_id)
+            except DatabaseError as e:
+                logger.error(f"Failed to load weekly boss votes: {e}")
+                await interaction.response.send_message("Failed to save your vote. Please try again later.", ephemeral=True)
+                return
+            if not found:
+                await interaction.response.send_message("This vote is no longer being tracked.", ephemeral=True)
+                return
+
+        try:
+            await vote_repo.replace_boss_ballot(message_id, user_id, bosses)
+        except DatabaseError as e:
+            logger.error(f"Failed to save weekly boss vote: {e}")
+            await interaction.response.send_message("Failed to save your vote. Please try again later.", ephemeral=True)
+            return
+
+        if bosses:
+            self.votes[message_id][user_id] = bosses
+            chosen = ", ".join(boss for boss in self.bosses if boss in bosses)
+            await interaction.response.send_message(f"Your vote has been recorded: {chosen}", ephemeral=True)
+        else:
+            self.votes[message_id].pop(user_id, None)
+            await interaction.response.send_message("Your vote has been cleared.", ephemeral=True)
 
     @app_commands.command(name="post_weekly_bosses", description="Post a message for users to vote for weekly guild bosses.")
     async def post_weekly_bosses(self, interaction: discord.Interaction):
         """
         Post a message for users to vote for weekly guild bosses.
         """
-        description = "React with the emoji corresponding to the boss you want to vote for. You can vote for multiple bosses."
+        description = "Pick the bosses you want to fight from the menu below. You can vote for multiple bosses and change your vote at any time."
         boss_list = "\n".join([f"{self.emoji_list[i]} {boss}" for i, boss in enumerate(self.bosses)])
         embed = discord.Embed(title="Weekly Guild Boss Voting", description=f"{description}\n\n{boss_list}")
-        await interaction.response.send_message(embed=embed)
+        # A single API call, the voting controls come with the message
+        await interaction.response.send_message(embed=embed, view=self.view)
         vote_message = await interaction.original_response()
 
-        # Add reactions for each boss using the emojis
-        for i in range(len(self.bosses)):
-            await vote_message.add_reaction(self.emoji_list[i])
+        self.votes[vote_message.id] = {}
+        self.post_guilds[vote_message.id] = interaction.guild.id
+        try:
+            await vote_repo.add_boss_post(vote_message.id, interaction.guild.id)
+        except DatabaseError as e:
+            logger.error(f"Failed to save weekly boss post {vote_message.id}, votes will not survive a restart: {e}")
 
     @app_commands.command(name="results_weekly_bosses", description="Get the results of the weekly guild boss voting.")
     async def results_weekly_bosses(self, interaction: discord.Interaction, message_id: str):
@@ -51,35 +164,39 @@ class WeeklyGuildBoss(commands.Cog):
         Display the results of the weekly guild boss voting.
         """
         try:
-            channel = interaction.channel
-            message = await channel.fetch_message(int(message_id))
-        except discord.NotFound:
-            await interaction.response.send_message("Message not found.", ephemeral=True)
+            message_id = int(message_id)
+        except ValueError:
+            await interaction.response.send_message("Please enter a valid message ID (a numeric ID).", ephemeral=True)
             return
-        except discord.HTTPException:
-            await interaction.response.send_message("Failed to retrieve the message.", ephemeral=True)
+
+        found = message_id in self.votes
+        if not found:
+            try:
+                found = await self.load_post(message_id)
+            except DatabaseError as e:
+                logger.error(f"Failed to load weekly boss votes: {e}")
+                await interaction.response.send_message("Failed to retrieve the votes.", ephemeral=True)
+                return
+        # A post of another server is treated as unknown
+        if not found or self.post_guilds[message_id] != interaction.guild_id:
+            await interaction.response.send_message("Message not found.", ephemeral=True)
             return
 
-        # Get reactions from the vote message
-        self.votes.clear()
-        for reaction in message.reactions:
-            if reaction.emoji in self.emoji_list:
-                index = self.emoji_list.index(reaction.emoji)
-                if 0 <= index < len(self.bosses):
-                    self.votes[self.bosses[index]] += reaction.count - 1  # Subtract bot's own reaction
+        # Counted from the local ballots of this post only
+        votes = Counter(boss for ballot in self.votes[message_id].values() for boss in ballot)
 
         # Prepare and send the results in an embed
-        total_votes = sum(self.votes.values())
+        total_votes = sum(votes.values())
         result_lines = []
-        for boss, votes in self.votes.items():
-            percentage = (votes / total_votes * 100) if total_votes > 0 else 0
+        for boss, count in votes.most_common():
+            percentage = (count / total_votes * 100) if total_votes > 0 else 0
             bar_length = int(percentage / 5)  # Create a bar out of 20 blocks
             bar = "{}{}".format("\u2588" * bar_length, "\u2591" * (20 - bar_length))  # Using Unicode escape codes for █ and ░
-            result_lines.append(f"{boss}\n{bar} {percentage:.2f}% ({votes} votes)")
+            result_lines.append(f"{boss}\n{bar} {percentage:.2f}% ({count} votes)")
 
-        result_message = "\n\n".join(result_lines)
+        result_message = "\n\n".join(result_lines) if result_lines else "No votes yet."
         embed = discord.Embed(title="Weekly Boss Voting Results", description=result_message)
         await interaction.response.send_message(embed=embed)
 
 async def setup(bot):
-    await bot.add_cog(WeeklyGuildBoss(bot))
\ No newline at end of file
+    await bot.add_cog(WeeklyGuildBoss(bot))
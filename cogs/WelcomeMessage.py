@@ -1,73 +1,56 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import os
-import mysql.connector
-from concurrent.futures import ThreadPoolExecutor
-import asyncio
 import logging
+from utils.database import DatabaseError
+from utils.repositories import welcome_repo
+from utils.dm_queue import DMQueue
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Database connection configuration using environment variables
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
-
 class WelcomeMessage(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_connection = None
-        self.executor = ThreadPoolExecutor()
+        self.welcome_messages = {}  # guild_id -> message, None when the guild has none
+        self.cache_loaded = False
+        # Welcome DMs are paced by a background worker instead of being sent inline
+        self.dm_queue = DMQueue(maxsize=200, interval=1.0)
 
-    def create_connection(self):
-        if self.db_connection is None or not self.db_connection.is_connected():
-            try:
-                logger.debug("Creating new database connection")
-                self.db_connection = mysql.connector.connect(**DB_CONFIG)
-                logger.debug("Database connection established successfully")
-            except mysql.connector.Error as err:
-                logger.error(f"Error connecting to the database: {err}")
+    def export_state(self):
+        # DMs still waiting in the queue are sent by the new instance
+        return {"welcome_messages": self.welcome_messages, "cache_loaded": self.cache_loaded, "dm_queue": self.dm_queue}
 
-    async def run_in_executor(self, func, *args):
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(self.executor, func, *args)
+    def import_state(self, state):
+        self.welcome_messages = state["welcome_messages"]
+        self.cache_loaded = state["cache_loaded"]
+        self.dm_queue = state["dm_queue"]
 
-    @commands.Cog.listener()
-    async def on_ready(self):
-        logger.debug("Bot is ready. Establishing database connection...")
-        self.create_connection()
+    async def cog_load(self):
+        self.dm_queue.start()
+        if not self.cache_loaded:
+            await self.load_welcome_messages()
+
+    def cog_unload(self):
+        self.dm_queue.stop()
+
+    async def load_welcome_messages(self):
+        # One query for every guild, after that joins are served from memory
+        try:
+            self.welcome_messages = await welcome_repo.all()
+        except DatabaseError as err:
+            logger.error(f"Error loading welcome messages: {err}")
+            return
+        self.cache_loaded = True
+        logger.debug(f"Cached welcome messages for {len(self.welcome_messages)} guilds")
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
         logger.debug(f"New member joined: {member.name} ({member.id})")
         guild_id = member.guild.id
-        self.create_connection()
-        cursor = self.db_connection.cursor()
-        try:
-            cursor.execute(
-                "SELECT message FROM welcome_messages WHERE guild_id = %s", (guild_id,)
-            )
-            result = cursor.fetchone()
-            welcome_message = result[0] if result else None
-            logger.debug(f"Fetched welcome message for guild {guild_id}: {welcome_message}")
-        except mysql.connector.Error as err:
-            logger.error(f"Error fetching welcome message: {err}")
-            welcome_message = None
-        finally:
-            cursor.close()
+        welcome_message = await self.get_welcome_message(guild_id)
         
         if welcome_message:
-            try:
-                await member.send(welcome_message)
-                logger.debug(f"Sent welcome message to {member.name}")
-            except discord.Forbidden:
-                logger.warning(f"Unable to DM {member.name}, maybe they have DMs disabled.")
+            self.dm_queue.enqueue(member, welcome_message, guild_id)
 
     @app_commands.command(name="set_welcome_message", description="Set the welcome message for new members.")
     @app_commands.describe(message="The welcome message to send to new members.")
@@ -78,8 +61,7 @@ class WelcomeMessage(commands.Cog):
         """
         guild_id = interaction.guild_id
         logger.debug(f"Setting welcome message for guild {guild_id} by {interaction.user.name}")
-        await self.run_in_executor(self.create_connection)
-        success = await self.run_in_executor(self.save_welcome_message, guild_id, message)
+        success = await self.save_welcome_message(guild_id, message)
         if success:
             await interaction.response.send_message("Welcome message set successfully for this server.", ephemeral=True)
         else:
@@ -93,35 +75,18 @@ class WelcomeMessage(commands.Cog):
             else:
                 await interaction.followup.send("You do not have permission to use this command. Only administrators can set the welcome message.", ephemeral=True)
 
-    def save_welcome_message(self, guild_id, message):
-        cursor = None
+    async def save_welcome_message(self, guild_id, message):
         try:
-            if not self.db_connection or not self.db_connection.is_connected():
-                logger.error("Database connection is not established or has been lost.")
-                return False
-
-            cursor = self.db_connection.cursor()
             logger.debug(f"Executing INSERT/UPDATE for guild_id {guild_id}")
-            cursor.execute(
-                """
-                INSERT INTO welcome_messages (guild_id, message) 
-                VALUES (%s, %s)
-                ON DUPLICATE KEY UPDATE message = %s
-                """,
-                (guild_id, message, message)
-            )
-            self.db_connection.commit()
-            affected_rows = cursor.rowcount
+            affected_rows = await welcome_repo.save(guild_id, message)
             logger.debug(f"Saved welcome message for guild {guild_id}, affected rows: {affected_rows}")
+            self.welcome_messages[guild_id] = message
             if affected_rows == 0:
                 logger.error("No rows were affected. This could mean the INSERT/UPDATE statement failed or there was no change.")
             return affected_rows > 0
-        except mysql.connector.Error as err:
+        except DatabaseError as err:
             logger.error(f"Error saving welcome message: {err}")
             return False
-        finally:
-            if cursor:
-                cursor.close()
 
     @app_commands.command(name="preview_welcome_message", description="Preview the welcome message for this server.")
     async def preview_welcome_message(self, interaction: discord.Interaction):
@@ -130,8 +95,7 @@ class WelcomeMessage(commands.Cog):
         """
         guild_id = interaction.guild_id
         logger.debug(f"Previewing welcome message for guild {guild_id} by {interaction.user.name}")
-        await self.run_in_executor(self.create_connection)
-        welcome_message = await self.run_in_executor(self.get_welcome_message, guild_id)
+        welcome_message = await self.get_welcome_message(guild_id)
         
         if welcome_message:
             try:
@@ -145,30 +109,18 @@ class WelcomeMessage(commands.Cog):
             await interaction.response.send_message("No welcome message set for this server.", ephemeral=True)
             logger.debug(f"No welcome message set for guild {guild_id}")
 
-    def get_welcome_message(self, guild_id):
-        cursor = None
+    async def get_welcome_message(self, guild_id):
+        if self.cache_loaded or guild_id in self.welcome_messages:
+            return self.welcome_messages.get(guild_id)
+        # The bulk load failed, fall back to a single lookup and remember the answer
         try:
-            if not self.db_connection or not self.db_connection.is_connected():
-                logger.error("Database connection is not established or has been lost.")
-                return None
-
-            cursor = self.db_connection.cursor()
-            cursor.execute(
-                "SELECT message FROM welcome_messages WHERE guild_id = %s", (guild_id,)
-            )
-            result = cursor.fetchone()
+            result = await welcome_repo.get(guild_id)
             logger.debug(f"Fetched welcome message for guild {guild_id}: {result}")
-            return result[0] if result else None
-        except mysql.connector.Error as err:
+        except DatabaseError as err:
             logger.error(f"Error fetching welcome message: {err}")
             return None
-        finally:
-            if cursor:
-                cursor.close()
+        self.welcome_messages[guild_id] = result
+        return self.welcome_messages[guild_id]
 
 async def setup(bot):
-    await bot.add_cog(WelcomeMessage(bot))
-    # Sync commands if not already synced
-    if not hasattr(bot, 'synced') or not bot.synced:
-        await bot.tree.sync()
-        bot.synced = True
\ No newline at end of file
+    await bot.add_cog(WelcomeMessage(bot))
\ No newline at end of file
@@ -0,0 +1,93 @@
+import discord
+from discord.ext import commands, tasks
+import logging
+import os
+from utils.loop_monitor import monitor
+from utils.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+class Diagnostics(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        # Optional Prometheus exports: a local /metrics endpoint and/or a textfile
+        self.metrics_port = os.getenv("METRICS_PORT")
+        self.metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.metrics_file = os.getenv("METRICS_FILE")
+
+    async def cog_load(self):
+        monitor.start()
+        if self.metrics_port:
+            try:
+                await telemetry.serve(self.metrics_host, int(self.metrics_port))
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not serve metrics on {self.metrics_host}:{self.metrics_port}: {e}")
+        if self.metrics_file:
+            self.export_metrics.start()
+
+    def cog_unload(self):
+        monitor.stop()
+        self.export_metrics.cancel()
+
+    @tasks.loop(seconds=30)
+    async def export_metrics(self):
+        try:
+            await telemetry.write_file(self.metrics_file)
+        except OSError as e:
+            logger.error(f"Could not write metrics to {self.metrics_file}: {e}")
+
+    @commands.command(name="latency")
+    @commands.is_owner()
+    async def latency(self, ctx):
+        """
+        Show the slowest commands, listeners and tasks by P95 wall time (bot owner only).
+        """
+        rows = telemetry.summary(limit=15)
+        if not rows:
+            await ctx.send("Nothing has been timed yet.")
+            return
+        lines = ["kind         name                       n     p50     p95   db avg  api avg"]
+        for kind, name, count, p50, p95, db_mean, api_mean in rows:
+            lines.append(
+                f"{kind[:12]:<12} {name[:26]:<26} {count:>5} {p50 * 1000:>5.0f}ms {p95 * 1000:>5.0f}ms "
+                f"{db_mean * 1000:>6.1f}ms {api_mean * 1000:>6.1f}ms"
+            )
+        # Percentiles are bucket upper bounds, so they read as "at most"
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+    @commands.command(name="looplag")
+    @commands.is_owner()
+    async def looplag(self, ctx):
+        """
+        Show event-loop lag percentiles and the most recent stalls (bot owner only).
+        """
+        lag = monitor.percentiles((50, 95, 99))
+        embed = discord.Embed(title="🩺 Event Loop Lag", color=discord.Color.orange())
+        embed.add_field(
+            name="Scheduling Delay",
+            value=(f"P50: `{lag[50] * 1000:.1f}ms`\n"
+                   f"P95: `{lag[95] * 1000:.1f}ms`\n"
+                   f"P99: `{lag[99] * 1000:.1f}ms`\n"
+                   f"Max: `{monitor.max_lag() * 1000:.1f}ms`"),
+            inline=False
+        )
+        embed.add_field(name="Samples", value=f"{len(monitor.samples)} (every {monitor.interval * 1000:.0f}ms)", inline=False)
+
+        stalls = list(monitor.stalls)[-5:]
+        if stalls:
+            lines = []
+            for stall in reversed(stalls):
+                duration = f"{stall.duration * 1000:.0f}ms" if stall.duration else "ongoing"
+                lines.append(f"<t:{int(stall.started_at.timestamp())}:R> **{duration}** in `{stall.task_name}` at `{stall.location}`")
+            embed.add_field(name=f"Recent Stalls (> {monitor.stall_threshold * 1000:.0f}ms)", value="\n".join(lines), inline=False)
+
+            # Show the innermost part of the most recent stack, Discord limits field size
+            stack = "".join(stalls[-1].stack[-4:])[-1000:]
+            embed.add_field(name="Last Stall Stack", value=f"```py\n{stack}\n```", inline=False)
+        else:
+            embed.add_field(name="Recent Stalls", value="None 🎉", inline=False)
+
+        await ctx.send(embed=embed)
+
+async def setup(bot):
+    await bot.add_cog(Diagnostics(bot))
@@ -1,86 +1,210 @@
-from discord import app_commands
-from discord.ext import commands
-from collections import defaultdict
-import discord
-
-item_reactions = defaultdict(list)
-
-class Drops(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
-
-    @app_commands.command(name="post_drops", description="Post the weekly guild boss drops.")
-    @app_commands.describe(
-        item1="Item 1",
-        item2="Item 2",
-        item3="Item 3",
-        item4="Item 4",
-        item5="Item 5",
-        item6="Item 6",
-        item7="Item 7"
-    )
-    async def post_drops(self, interaction: discord.Interaction, item1: str, item2: str, item3: str, item4: str, item5: str, item6: str, item7: str):
-        items = [item1, item2, item3, item4, item5, item6, item7]
-        emoji_numbers = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣']  # Correct Unicode emoji list
-
-        embed = discord.Embed(
-            title="Weekly Guild Boss Drops",
-            description="React to the items you need!",
-            color=discord.Color.blue()
-        )
-
-        # Add items to a single field with extra spacing
-        item_list = "\n\n".join([f"{emoji} **{item}**" for emoji, item in zip(emoji_numbers, items)])
-        embed.add_field(name="Items", value=item_list, inline=False)
-
-        # Send the embed message
-        await interaction.response.send_message(embed=embed)
-        message = await interaction.original_response()
-
-        # Adding reactions (use emoji numbers 1-7)
-        for emoji in emoji_numbers:
-            await message.add_reaction(emoji)
-
-        # Storing message ID and reactions for reference
-        item_reactions[message.id] = items
-
-    @app_commands.command(name="get_votes", description="Get the votes for each item.")
-    @app_commands.describe(message_id="The ID of the message to get votes from")
-    async def get_votes(self, interaction: discord.Interaction, message_id: str):
-        await interaction.response.defer()  # Acknowledge interaction to prevent timeout
-
-        try:
-            message_id = int(message_id)
-            message = await interaction.channel.fetch_message(message_id)
-        except ValueError:
-            await interaction.followup.send("Please enter a valid message ID (a numeric ID).", ephemeral=True)
-            return
-        except discord.NotFound:
-            await interaction.followup.send("Message not found. Please make sure the ID is correct.", ephemeral=True)
-            return
-
-        if message.id not in item_reactions:
-            await interaction.followup.send("This message ID has no associated reactions recorded.", ephemeral=True)
-            return
-
-        items = item_reactions[message.id]
-        results = defaultdict(list)
-        emoji_numbers = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣']
-
-        for reaction in message.reactions:
-            if reaction.emoji in emoji_numbers:
-                item_index = emoji_numbers.index(reaction.emoji)
-                if item_index >= len(items):
-                    continue
-
-                users = [user async for user in reaction.users()]
-                for user in users:
-                    if user != self.bot.user:
-                        member = interaction.guild.get_member(user.id)
-                        results[items[item_index]].append(member.display_name if member else user.name)
-
-        results_text = "\n".join([f"**{item}**: {', '.join(users) if users else 'No votes'}" for item, users in results.items()])
-        await interaction.followup.send(f"Reaction results:\n{results_text if results_text else 'No votes yet!'}")
-
-async def setup(bot):
-    await bot.add_cog(Drops(bot))
+from discord import app_commands
+from discord.ext import commands
+import asyncio
+import discord
+import json
+import logging
+from utils.database import DatabaseError
+from utils.repositories import vote_repo
+
+logger = logging.getLogger(__name__)
+
+EMOJI_NUMBERS = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣']  # Correct Unicode emoji list
+
+# Posts older than this are not preloaded, /get_votes and new reactions still find them in the database
+PRELOAD_DAYS = 30
+
+# How many message IDs known not to be drop posts are remembered, so other reactions skip the database
+NOT_POSTS_LIMIT = 1000
+
+class Drops(commands.Cog):
+    """
+    Weekly drop posts with reaction votes.
+
+    Votes are tracked live from raw reaction events into an in-memory tally
+    (message -> one set of voter IDs per item) and persisted as they happen,
+    so /get_votes answers without any Discord API calls, even after a restart.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.posts = {}    # message_id -> list of item names
+        self.tallies = {}  # message_id -> list of voter ID sets, one per item
+        self.post_guilds = {}  # message_id -> guild the post was made in
+        self.not_posts = set()
+        # A post that wasn't preloaded is loaded once, however many reactions arrive meanwhile
+        self.load_lock = asyncio.Lock()
+        # Serialises vote writes so an add and a quick remove reach the database in order
+        self.write_lock = asyncio.Lock()
+        self.restored = False
+
+    def export_state(self):
+        return {"posts": self.posts, "tallies": self.tallies, "post_guilds": self.post_guilds}
+
+    def import_state(self, state):
+        # State from before posts knew their guild is dropped, cog_load reloads it from the database
+        if "post_guilds" not in state:
+            return
+        self.posts = state["posts"]
+        self.tallies = state["tallies"]
+        self.post_guilds = state["post_guilds"]
+        self.restored = True
+
+    async def cog_load(self):
+        if self.restored:
+            return
+        try:
+            posts, votes = await vote_repo.recent_drop_posts(PRELOAD_DAYS)
+        except DatabaseError as e:
+            logger.error(f"Failed to load drop votes: {e}")
+            return
+        for post in posts:
+            self.track_post(post['message_id'], post['guild_id'], json.loads(post['items']))
+        for vote in votes:
+            self.tallies[vote['message_id']][vote['item_index']].add(vote['user_id'])
+
+    def track_post(self, message_id, guild_id, items):
+        self.posts[message_id] = items
+        self.post_guilds[message_id] = guild_id
+        self.tallies[message_id] = [set() for _ in items]
+
+    async def load_post(self, message_id):
+        """Load a post and its votes that weren't preloaded. Returns False if it isn't a drop post."""
+        post = await vote_repo.drop_post(message_id)
+        if post is None:
+            return False
+        guild_id, items, votes = post
+        self.track_post(message_id, guild_id, json.loads(items))
+        for vote in votes:
+            self.tallies[message_id][vote['item_index']].add(vote['user_id'])
+        return True
+
+    async def ensure_post(self, message_id):
+        """Make sure a post's tally is in memory. Returns False if it isn't a drop post."""
+        if message_id in self.tallies:
+            return True
+        if message_id in self.not_posts:
+            return False
+        async with self.load_lock:
+            if message_id in self.tallies:
+                return True
+            found = await self.load_post(message_id)
+        if not found:
+            if len(self.not_posts) >= NOT_POSTS_LIMIT:
+                self.not_posts.clear()
+            self.not_posts.add(message_id)
+        return found
+
+    async def vote_index(self, payload):
+        # Returns the item index a reaction event refers to, or None if it isn't a vote we track
+        if payload.user_id == self.bot.user.id:
+            return None
+        emoji = str(payload.emoji)
+        if emoji not in EMOJI_NUMBERS:
+            return None
+        # Posts older than PRELOAD_DAYS, or all of them if the preload failed, are loaded on their first reaction
+        try:
+            if not await self.ensure_post(payload.message_id):
+                return None
+        except DatabaseError as e:
+            logger.error(f"Failed to load drop post {payload.message_id}, reaction not counted: {e}")
+            return None
+        index = EMOJI_NUMBERS.index(emoji)
+        return index if index < len(self.posts[payload.message_id]) else None
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        index = await self.vote_index(payload)
+        if index is None:
+            return
+        self.tallies[payload.message_id][index].add(payload.user_id)
+        async with self.write_lock:
+            try:
+                await vote_repo.add_drop_vote(payload.message_id, index, payload.user_id)
+            except DatabaseError as e:
+                logger.error(f"Failed to save drop vote: {e}")
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        index = await self.vote_index(payload)
+        if index is None:
+            return
+        self.tallies[payload.message_id][index].discard(payload.user_id)
+        async with self.write_lock:
+            try:
+                await vote_repo.remove_drop_vote(payload.message_id, index, payload.user_id)
+            except DatabaseError as e:
+                logger.error(f"Failed to remove drop vote: {e}")
+
+    @app_commands.command(name="post_drops", description="Post the weekly guild boss drops.")
+    @app_commands.describe(
+        item1="Item 1",
+        item2="Item 2",
+        item3="Item 3",
+        item4="Item 4",
+        item5="Item 5",
+        item6="Item 6",
+        item7="Item 7"
+    )
+    async def post_drops(self, interaction: discord.Interaction, item1: str, item2: str, item3: str, item4: str, item5: str, item6: str, item7: str):
+        items = [item1, item2, item3, item4, item5, item6, item7]
+
+        embed = discord.Embed(
+            title="Weekly Guild Boss Drops",
+            description="React to the items you need!",
+            color=discord.Color.blue()
+        )
+
+        # Add items to a single field with extra spacing
+        item_list = "\n\n".join([f"{emoji} **{item}**" for emoji, item in zip(EMOJI_NUMBERS, items)])
+        embed.add_field(name="Items", value=item_list, inline=False)
+
+        # Send the embed message
+        await interaction.response.send_message(embed=embed)
+        message = await interaction.original_response()
+
+        # Start tracking before adding reactions so no early vote is missed
+        self.track_post(message.id, interaction.guild.id, items)
+        try:
+            await vote_repo.add_drop_post(message.id, interaction.guild.id, message.channel.id, json.dumps(items))
+        except DatabaseError as e:
+            logger.error(f"Failed to save drop post {message.id}, votes will not survive a restart: {e}")
+
+        # Adding reactions (use emoji numbers 1-7)
+        for emoji in EMOJI_NUMBERS:
+            await message.add_reaction(emoji)
+
+    @app_commands.command(name="get_votes", description="Get the votes for each item.")
+    @app_commands.describe(message_id="The ID of the message to get votes from")
+    async def get_votes(self, interaction: discord.Interaction, message_id: str):
+        try:
+            message_id = int(message_id)
+        except ValueError:
+            await interaction.response.send_message("Please enter a valid message ID (a numeric ID).", ephemeral=True)
+            return
+
+        try:
+            found = await self.ensure_post(message_id)
+        except DatabaseError as e:
+            logger.error(f"Failed to load drop post {message_id}: {e}")
+            await interaction.response.send_message("An error occurred while accessing the database. Please try again later.", ephemeral=True)
+            return
+        # Posts of other servers are treated as unknown
+        if not found or self.post_guilds[message_id] != interaction.guild_id:
+            await interaction.response.send_message("This message ID has no associated reactions recorded.", ephemeral=True)
+            return
+
+        lines = []
+        for item, voters in zip(self.posts[message_id], self.tallies[message_id]):
+            names = []
+            for user_id in voters:
+                # Resolved from the local member cache, no API calls
+                member = interaction.guild.get_member(user_id)
+                user = member or self.bot.get_user(user_id)
+                names.append(member.display_name if member else user.name if user else f"<@{user_id}>")
+            lines.append(f"**{item}**: {', '.join(sorted(names)) if names else 'No votes'}")
+
+        await interaction.response.send_message("Reaction results:\n" + "\n".join(lines))
+
+async def setup(bot):
+    await bot.add_cog(Drops(bot))
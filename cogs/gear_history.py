@@ -0,0 +1,124 @@
+import time
+from typing import Optional
+import discord
+from discord import app_commands
+from discord.ext import commands, tasks
+from utils.database import DatabaseError
+from utils.gear_history import rollup, sparkline, week_of, week_start, weekly_scores
+from utils.repositories import gear_repo
+from utils.roster import member_buffer
+from utils.telemetry import telemetry
+
+# Discord rejects messages longer than this
+MESSAGE_LIMIT = 2000
+
+def week_label(week):
+    return week_start(week).strftime("%y-%m-%d")
+
+def fit_table(title, header, rows, footer):
+    # Drop the oldest weeks until the message fits
+    while True:
+        text = f"{title}\n```\n{header}\n" + "\n".join(rows) + f"\n```\n{footer}"
+        if len(text) <= MESSAGE_LIMIT or len(rows) <= 1:
+            return text
+        rows = rows[1:]
+
+class GearHistory(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.rollup_weekly.start()
+
+    def cog_unload(self):
+        self.rollup_weekly.cancel()
+
+    @tasks.loop(hours=1)
+    @telemetry.timed("task")
+    async def rollup_weekly(self):
+        # Refreshes this week's aggregates from the roster, the last run of a week freezes it
+        week = week_of(time.time())
+        try:
+            await member_buffer.flush()
+            scores = {}
+            for guild_id, gear_score in await gear_repo.roster_scores():
+                scores.setdefault(guild_id, []).append(gear_score)
+            if scores:
+                await gear_repo.save_weekly([(guild_id, week, *rollup(values)) for guild_id, values in scores.items()])
+        except DatabaseError as err:
+            print(f"Database error while rolling up gear score history: {err}")
+
+    @rollup_weekly.before_loop
+    async def before_rollup_weekly(self):
+        await self.bot.wait_until_ready()
+
+    @app_commands.command(name="gear_history", description="Show how a member's gear score progressed week by week.")
+    @app_commands.describe(member="Whose history to show, yourself if left out", weeks="How many weeks to show")
+    async def gear_history(self, interaction: discord.Interaction, member: Optional[discord.Member] = None,
+                           weeks: app_commands.Range[int, 1, 52] = 12):
+        member = member or interaction.user
+        guild_id = interaction.guild.id
+        try:
+            # A buffered /add_member is part of the history too
+            await member_buffer.flush(guild_id)
+            events = await gear_repo.member_events(guild_id, member.id)
+        except DatabaseError as err:
+            print(f"Database error: {err}")
+            await interaction.response.send_message("An error occurred while accessing the database. Please try again later.", ephemeral=True)
+            return
+
+        series = weekly_scores(events)
+        if not series:
+            await interaction.response.send_message(f"No gear score history for {member.display_name} yet.", ephemeral=True)
+            return
+
+        # One row per week, weeks without a change keep the previous score
+        current = week_of(time.time())
+        first = max(series[0][0], current - weeks + 1)
+        by_week = dict(series)
+        score = 0
+        for week, value in series:
+            if week < first:
+                score = value
+        rows, values = [], []
+        for week in range(first, current + 1):
+            # The first recorded score has nothing to compare against
+            change = by_week[week] - score if week in by_week and score else 0
+            score = by_week.get(week, score)
+            values.append(score)
+            rows.append(f"{week_label(week)} {score:>6} {change:>+7}" if change else f"{week_label(week)} {score:>6}")
+
+        text = fit_table(
+            f"**Gear score history of {member.display_name}**",
+            "Week      Score  Change",
+            rows,
+            f"{sparkline(values)}  {values[0]} → {values[-1]}",
+        )
+        await interaction.response.send_message(text)
+
+    @app_commands.command(name="guild_progress", description="Show the guild's weekly average, median and top 10% gear score.")
+    @app_commands.describe(weeks="How many weeks to show")
+    async def guild_progress(self, interaction: discord.Interaction, weeks: app_commands.Range[int, 1, 52] = 12):
+        guild_id = interaction.guild.id
+        try:
+            rows = await gear_repo.weekly(guild_id, week_of(time.time()) - weeks + 1)
+        except DatabaseError as err:
+            print(f"Database error: {err}")
+            await interaction.response.send_message("An error occurred while accessing the database. Please try again later.", ephemeral=True)
+            return
+
+        if not rows:
+            await interaction.response.send_message("No guild progress recorded yet, it is rolled up once an hour.", ephemeral=True)
+            return
+
+        text = fit_table(
+            "**Guild gear score progress**",
+            "Week       Avg   Med  Top10%    N",
+            [
+                f"{week_label(row['week'])} {row['average']:>5} {row['median']:>5} {row['top_decile']:>7} {row['members']:>4}"
+                for row in rows
+            ],
+            f"Average {sparkline([row['average'] for row in rows])}  {rows[0]['average']} → {rows[-1]['average']}",
+        )
+        await interaction.response.send_message(text)
+
+async def setup(bot):
+    await bot.add_cog(GearHistory(bot))
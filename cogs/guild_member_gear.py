@@ -1,39 +1,49 @@
 import discord
+from typing import Literal
 from discord import app_commands
-from discord.ext import commands
-import mysql.connector
-from mysql.connector import pooling
-import os
-
-# Database connection configuration using environment variables
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME")
-}
-
-# List of valid weapon options
-VALID_WEAPONS = [
-    "Staff", "Dagger", "SwordAndShield", "Greatsword", "Long Bow", "Crossbow", "WandAndTome"
-]
+from discord.ext import commands, tasks
+from utils.database import DatabaseError
+from utils.repositories import member_repo
+from utils.guild_stats import guild_stats
+from utils.roster_io import RosterFileError, read_rows, validate_rows, write_roster_file
+from utils.roster import (
+    FLUSH_INTERVAL, PAGE_SIZE, VALID_CLASSES, VALID_WEAPONS, count_members, cursor_of, fetch_page, member_buffer, roster_cache
+)
+from utils.telemetry import telemetry
+
+# Largest roster file /import_roster accepts
+MAX_IMPORT_BYTES = 1024 * 1024
+# How many validation errors /import_roster lists before summarising the rest
+MAX_REPORTED_ERRORS = 10
 
 class PagedGuildMembersView(discord.ui.View):
-    def __init__(self, members, items_per_page=10):
-        super().__init__()
+    """
+    Pages through a guild's roster, fetching one page at a time.
+
+    Only the page on screen is held in memory; moving to the next or previous
+    page runs a keyset query starting from the first or last row shown.
+    """
+
+    def __init__(self, guild_id, members, total_members, items_per_page=PAGE_SIZE, timeout=300):
+        super().__init__(timeout=timeout)
+        self.guild_id = guild_id
         self.members = members
+        self.total_members = total_members
         self.items_per_page = items_per_page
         self.current_page = 0
+        self.message = None
         self.update_buttons()
 
+    @property
+    def page_count(self):
+        return max(1, (self.total_members - 1) // self.items_per_page + 1)
+
     def update_buttons(self):
         self.previous_button.disabled = self.current_page <= 0
-        self.next_button.disabled = self.current_page >= (len(self.members) - 1) // self.items_per_page
+        self.next_button.disabled = self.current_page >= self.page_count - 1
 
     def get_page_text(self):
-        start = self.current_page * self.items_per_page
-        end = start + self.items_per_page
-        page_members = self.members[start:end]
+        page_members = self.members
 
         text = "**Guild Members List**\n"
         text += "```diff\n"
@@ -58,48 +68,72 @@ class PagedGuildMembersView(discord.ui.View):
             )
 
         text += "```"
-        text += f"Page {self.current_page + 1} of {(len(self.members) - 1) // self.items_per_page + 1}"
+        text += f"Page {self.current_page + 1} of {self.page_count}"
 
         return text
 
+    async def show_page(self, interaction, cursor, backwards):
+        try:
+            page = await fetch_page(self.guild_id, cursor, backwards, self.items_per_page)
+        except DatabaseError as err:
+            print(f"Database error: {err}")
+            await interaction.response.send_message("An error occurred while accessing the database. Please try again later.", ephemeral=True)
+            return
+        if not page:
+            # The roster shrank since this view was opened, there is nothing further this way
+            if not backwards:
+                self.total_members = (self.current_page + 1) * self.items_per_page
+            self.update_buttons()
+            await interaction.response.edit_message(content=self.get_page_text(), view=self)
+            return
+        self.members = page
+        self.current_page += -1 if backwards else 1
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.get_page_text(), view=self)
+
     @discord.ui.button(label="Previous", style=discord.ButtonStyle.primary)
     async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         if self.current_page > 0:
-            self.current_page -= 1
-            self.update_buttons()
-            await interaction.response.edit_message(content=self.get_page_text(), view=self)
+            await self.show_page(interaction, cursor_of(self.members[0]), backwards=True)
 
     @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
     async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.current_page < (len(self.members) - 1) // self.items_per_page:
-            self.current_page += 1
-            self.update_buttons()
-            await interaction.response.edit_message(content=self.get_page_text(), view=self)
+        if self.current_page < self.page_count - 1:
+            await self.show_page(interaction, cursor_of(self.members[-1]), backwards=False)
+
+    async def on_timeout(self):
+        # Release the page and grey out the buttons
+        self.members = []
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+        self.message = None
 
 class GuildMemberGear(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db_connection = db_manager.get_connection()
-        self.create_table()
-
-    def create_table(self):
-        cursor = self.db_connection.cursor()
-        cursor.execute(
-            '''
-            CREATE TABLE IF NOT EXISTS guild_members (
-                discord_id BIGINT,
-                guild_id BIGINT,
-                ingame_name VARCHAR(255),
-                gear_score INT,
-                class ENUM('Healer', 'DPS', 'Tank'),
-                main_hand ENUM('Staff', 'Dagger', 'SwordAndShield', 'Greatsword', 'Long Bow', 'Crossbow', 'WandAndTome'),
-                offhand ENUM('Staff', 'Dagger', 'SwordAndShield', 'Greatsword', 'Long Bow', 'Crossbow', 'WandAndTome'),
-                PRIMARY KEY (discord_id, guild_id)
-            )
-            '''
-        )
-        cursor.close()
-        self.db_connection.commit()
+        self.flush_member_writes.start()
+
+    async def cog_unload(self):
+        self.flush_member_writes.cancel()
+        try:
+            await member_buffer.flush()
+        except DatabaseError as err:
+            # The buffer is shared, so the reloaded cog retries them
+            print(f"Database error while flushing member updates: {err}")
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    @telemetry.timed("task")
+    async def flush_member_writes(self):
+        # /add_member only buffers its row, this writes the latest one per member
+        try:
+            await member_buffer.flush()
+        except DatabaseError as err:
+            print(f"Database error while flushing member updates: {err}")
 
     @app_commands.command(name="add_member", description="Add or update your guild member gear information.")
     @app_commands.describe(
@@ -122,54 +156,46 @@ class GuildMemberGear(commands.Cog):
             )
             return
 
-        valid_classes = ["Healer", "DPS", "Tank"]
-        if guild_class not in valid_classes:
+        if guild_class not in VALID_CLASSES:
             await interaction.response.send_message(
-                f"Invalid class! Please choose from: {', '.join(valid_classes)}", ephemeral=True
+                f"Invalid class! Please choose from: {', '.join(VALID_CLASSES)}", ephemeral=True
             )
             return
 
         guild_id = interaction.guild.id
 
-        if not self.db_connection.is_connected():
-            self.db_connection = db_manager.get_connection()
-
-        if not self.db_connection:
-            await interaction.response.send_message(
-                "Database connection could not be established. Please try again later.", ephemeral=True
-            )
-            return
-
-        cursor = self.db_connection.cursor()
-        try:
-            query = '''
-                REPLACE INTO guild_members (discord_id, guild_id, ingame_name, gear_score, class, main_hand, offhand) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            '''
-            cursor.execute(query, (interaction.user.id, guild_id, ingame_name, gear_score, guild_class, main_hand, offhand))
-            self.db_connection.commit()
-            await interaction.response.send_message("Your guild member information has been added/updated successfully.", ephemeral=True)
-        except mysql.connector.Error as err:
-            print(f"Database error: {err}")
-            await interaction.response.send_message("An error occurred while accessing the database. Please try again later.", ephemeral=True)
-        finally:
-            cursor.close()
+        member = {
+            'discord_id': interaction.user.id,
+            'guild_id': guild_id,
+            'ingame_name': ingame_name,
+            'gear_score': gear_score,
+            'class': guild_class,
+            'main_hand': main_hand,
+            'offhand': offhand
+        }
+        # Written in the background together with other updates, reads flush it first
+        member_buffer.put(member)
+        await interaction.response.send_message("Your guild member information has been added/updated successfully.", ephemeral=True)
 
     @app_commands.command(name="guildmembers", description="Display a paginated list of guild members sorted by gear score.")
     async def guildmembers(self, interaction: discord.Interaction):
         guild_id = interaction.guild.id
 
-        cursor = self.db_connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM guild_members WHERE guild_id = %s ORDER BY gear_score DESC", (guild_id,))
-        members = cursor.fetchall()
-        cursor.close()
+        try:
+            members = await fetch_page(guild_id)
+            total_members = await count_members(guild_id) if members else 0
+        except DatabaseError as err:
+            print(f"Database error: {err}")
+            await interaction.response.send_message("An error occurred while accessing the database. Please try again later.", ephemeral=True)
+            return
 
         if not members:
             await interaction.response.send_message("No members found in the database.", ephemeral=True)
             return
 
-        view = PagedGuildMembersView(members)
+        view = PagedGuildMembersView(guild_id, members, total_members)
         await interaction.response.send_message(content=view.get_page_text(), view=view)
+        view.message = await interaction.original_response()
 
     @app_commands.command(name="remove_member", description="Remove a guild member from the database (only server owner can use).")
     @app_commands.describe(ingame_name="The in-game name of the member to remove.")
@@ -183,52 +209,92 @@ class GuildMemberGear(commands.Cog):
 
         guild_id = interaction.guild.id
 
-        if not self.db_connection.is_connected():
-            self.db_connection = db_manager.get_connection()
+        try:
+            # A buffered update written after the delete would bring the member back
+            await member_buffer.flush(guild_id)
+            removed = await member_repo.delete_by_name(guild_id, ingame_name)
+            guild_stats.record_delete(guild_id, removed)
+            roster_cache.invalidate(guild_id)
+        except DatabaseError as err:
+            print(f"Database error: {err}")
+            await interaction.response.send_message("An error occurred while accessing the database. Please try again later.", ephemeral=True)
+            return
 
-        if not self.db_connection:
+        if not removed:
             await interaction.response.send_message(
-                "Database connection could not be established. Please try again later.",
+                f"No member found with the in-game name '{ingame_name}' in this guild.",
                 ephemeral=True
             )
             return
+        await interaction.response.send_message(f"Member with in-game name '{ingame_name}' has been successfully removed.", ephemeral=True)
+
+    @app_commands.command(name="import_roster", description="Add or update many guild members at once from a CSV or JSON file.")
+    @app_commands.describe(file="CSV or JSON with discord_id, ingame_name, gear_score, class, main_hand and offhand")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def import_roster(self, interaction: discord.Interaction, file: discord.Attachment):
+        if file.size > MAX_IMPORT_BYTES:
+            await interaction.response.send_message(
+                f"The file is too large, the limit is {MAX_IMPORT_BYTES // 1024} KB.", ephemeral=True
+            )
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        guild_id = interaction.guild.id
 
-        cursor = self.db_connection.cursor()
         try:
-            cursor.execute("SELECT * FROM guild_members WHERE ingame_name = %s AND guild_id = %s", (ingame_name, guild_id))
-            member = cursor.fetchone()
-
-            if not member:
-                await interaction.response.send_message(
-                    f"No member found with the in-game name '{ingame_name}' in this guild.",
-                    ephemeral=True
-                )
-                return
-
-            cursor.execute("DELETE FROM guild_members WHERE ingame_name = %s AND guild_id = %s", (ingame_name, guild_id))
-            self.db_connection.commit()
-            await interaction.response.send_message(f"Member with in-game name '{ingame_name}' has been successfully removed.", ephemeral=True)
-        except mysql.connector.Error as err:
+            rows = read_rows(await file.read(), file.filename)
+        except RosterFileError as err:
+            await interaction.followup.send(f"Could not read the file: {err}", ephemeral=True)
+            return
+        members, errors = validate_rows(rows, guild_id)
+        if errors:
+            # Nothing is written unless the whole file is valid
+            report = "\n".join(errors[:MAX_REPORTED_ERRORS])
+            if len(errors) > MAX_REPORTED_ERRORS:
+                report += f"\n...and {len(errors) - MAX_REPORTED_ERRORS} more"
+            await interaction.followup.send(
+                f"Nothing was imported, {len(errors)} of {len(rows)} entries are invalid:\n```\n{report}\n```", ephemeral=True
+            )
+            return
+        if not members:
+            await interaction.followup.send("The file contains no members.", ephemeral=True)
+            return
+
+        try:
+            # Older buffered updates must not overwrite the imported rows later
+            await member_buffer.flush(guild_id)
+            await member_repo.upsert_many(members)
+        except DatabaseError as err:
             print(f"Database error: {err}")
-            await interaction.response.send_message("An error occurred while accessing the database. Please try again later.", ephemeral=True)
-        finally:
-            cursor.close()
+            await interaction.followup.send("An error occurred while accessing the database. Nothing was imported.", ephemeral=True)
+            return
+        # Rebuilt from the database on the next read instead of applying every row
+        guild_stats.invalidate(guild_id)
+        roster_cache.invalidate(guild_id)
+        await interaction.followup.send(f"Imported {len(members)} guild members.", ephemeral=True)
+
+    @app_commands.command(name="export_roster", description="Download this server's guild member list as a CSV or JSON file.")
+    @app_commands.describe(file_format="File format of the export")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def export_roster(self, interaction: discord.Interaction, file_format: Literal["csv", "json"] = "csv"):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            export, count = await write_roster_file(interaction.guild.id, file_format)
+        except DatabaseError as err:
+            print(f"Database error: {err}")
+            await interaction.followup.send("An error occurred while accessing the database. Please try again later.", ephemeral=True)
+            return
+        with export:
+            await interaction.followup.send(
+                f"Exported {count} guild members.",
+                file=discord.File(export, filename=f"roster-{interaction.guild.id}.{file_format}"),
+                ephemeral=True
+            )
+
+    @import_roster.error
+    @export_roster.error
+    async def roster_file_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.errors.MissingPermissions):
+            await interaction.response.send_message("You do not have permission to use this command. Only administrators can import or export the roster.", ephemeral=True)
 
 async def setup(bot):
     await bot.add_cog(GuildMemberGear(bot))
-
-class DatabaseManager:
-    def __init__(self, config):
-        self.config = config
-        self.pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=5, **config)
-
-    def get_connection(self):
-        try:
-            connection = self.pool.get_connection()
-            connection.ping(reconnect=True)
-            return connection
-        except mysql.connector.Error as err:
-            print(f"Error: {err}")
-            return None
-
-db_manager = DatabaseManager(DB_CONFIG)
@@ -1,52 +1,127 @@
 import discord
-from discord.ext import commands
-import psutil
+from discord import app_commands
+from discord.ext import commands, tasks
 import platform
 import time
+from utils.metrics import sampler
+from utils.telemetry import telemetry
 
 class PingPong(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.start_time = time.time()
+        self.start_time = sampler.started_at  # Survives !reload
+        self.counts = sampler.counts
+        if bot.is_ready():
+            # Loaded by !reload, READY has already happened
+            self.counts.recount(bot.guilds)
+        sampler.start()
+        self.sample_metrics.start()
+
+    def cog_unload(self):
+        self.sample_metrics.cancel()
+
+    @tasks.loop(minutes=1)
+    @telemetry.timed("task")
+    async def sample_metrics(self):
+        sampler.sample(self.bot)
+
+    @sample_metrics.before_loop
+    async def before_sample_metrics(self):
+        await self.bot.wait_until_ready()
+
+    # Keep the guild, member and channel totals current from gateway events
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.counts.recount(self.bot.guilds)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.counts.add_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.counts.add_guild(guild, -1)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.counts.members += 1
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.counts.members -= 1
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self.counts.channels += 1
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.counts.channels -= 1
 
     @commands.command(name="ping")
     async def ping(self, ctx):
         # Calculate bot latency (Ping)
         bot_latency = round(self.bot.latency * 1000, 2)  # Latency in milliseconds
-        
-        # Gather CPU and memory usage
-        cpu_usage = psutil.cpu_percent()
-        memory = psutil.virtual_memory()
-        memory_usage = memory.percent
-        
+
+        # CPU and memory come from the last background sample, a single call has nothing to measure against
+        latest = sampler.latest
+        cpu_usage = f"{latest.cpu_percent:.1f}%" if latest and latest.cpu_percent is not None else "n/a (first sample pending)"
+        memory_usage = f"{latest.rss_bytes / 2**20:.1f} MB" if latest else "n/a"
+
         # Calculate uptime
         uptime_seconds = time.time() - self.start_time
         uptime_hours = round(uptime_seconds / 3600, 2)
-        
+
         # Get Python version
         python_version = platform.python_version()
-        
+
         # Get additional bot information
-        guild_count = len(self.bot.guilds)  # Number of servers the bot is in
-        user_count = len(set(self.bot.get_all_members()))  # Number of unique users the bot can interact with
-        channel_count = sum(1 for _ in self.bot.get_all_channels())  # Number of channels the bot has access to
+        import psutil
         disk_usage = psutil.disk_usage('/')
         disk_usage_percent = disk_usage.percent  # Disk usage percentage
         os_info = platform.system() + " " + platform.release()  # Operating system information
 
         # Create response message
         response = (f"Bot Latency: {bot_latency}ms\n"
-                    f"CPU Usage: {cpu_usage}%\n"
-                    f"Memory Usage: {memory_usage}%\n"
+                    f"CPU Usage: {cpu_usage}\n"
+                    f"Memory Usage: {memory_usage}\n"
                     f"Disk Usage: {disk_usage_percent}%\n"
                     f"Uptime: {uptime_hours} hours\n"
                     f"Python Version: {python_version}\n"
                     f"Operating System: {os_info}\n"
-                    f"Number of Servers: {guild_count}\n"
-                    f"Number of Users: {user_count}\n"
-                    f"Number of Channels: {channel_count}")
-        
+                    f"Number of Servers: {self.counts.guilds}\n"
+                    f"Number of Members: {self.counts.members}\n"
+                    f"Number of Channels: {self.counts.channels}")
+
         await ctx.send(response)
 
+    @app_commands.command(name="stats", description="Show the bot's resource usage and latency over the last hour.")
+    async def stats(self, interaction: discord.Interaction):
+        embed = discord.Embed(title="📈 Bot Stats (last hour)", color=discord.Color.green())
+
+        rows = (
+            ("CPU", "cpu_percent", lambda v: f"{v:.1f}%"),
+            ("Memory (RSS)", "rss_bytes", lambda v: f"{v / 2**20:.1f} MB"),
+            ("Event Loop Lag (P99)", "loop_lag", lambda v: f"{v * 1000:.1f}ms"),
+            ("Gateway Latency", "gateway_latency", lambda v: f"{v * 1000:.1f}ms"),
+        )
+        for name, field, fmt in rows:
+            summary = sampler.summary(field)
+            if summary is None:
+                value = "No samples yet"
+            else:
+                low, avg, high = summary
+                value = f"Min: `{fmt(low)}`\nAvg: `{fmt(avg)}`\nMax: `{fmt(high)}`"
+            embed.add_field(name=name, value=value, inline=True)
+
+        embed.add_field(
+            name="Reach",
+            value=f"{self.counts.guilds} servers · {self.counts.members} members · {self.counts.channels} channels",
+            inline=False
+        )
+        uptime_hours = (time.time() - self.start_time) / 3600
+        embed.set_footer(text=f"{len(sampler.samples)} samples, one per minute · Uptime {uptime_hours:.2f} hours")
+        await interaction.response.send_message(embed=embed)
+
 async def setup(bot):
     await bot.add_cog(PingPong(bot))
\ No newline at end of file
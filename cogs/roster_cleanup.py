@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from discord.ext import commands, tasks
+from utils.database import DatabaseError
+from utils.guild_stats import guild_stats
+from utils.repositories import member_repo
+from utils.roster import member_buffer, roster_cache
+from utils.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Flush straight away once this many departures are waiting, e.g. during a purge
+FLUSH_THRESHOLD = 100
+
+class RosterCleanup(commands.Cog):
+    """
+    Removes people from guild_members once they leave the Discord server.
+
+    Departures are queued per guild and deleted in batches, every 30 seconds
+    or as soon as FLUSH_THRESHOLD are waiting. A reconciliation sweep every
+    six hours compares each guild's member list against its rows and
+    removes anyone the listener missed, e.g. while the bot was offline.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.departures = {}  # guild_id -> set of Discord IDs waiting to be deleted
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = None
+
+    def export_state(self):
+        return {"departures": self.departures}
+
+    def import_state(self, state):
+        self.departures = state["departures"]
+
+    async def cog_load(self):
+        self.flush_departures.start()
+        self.reconcile_roster.start()
+
+    def cog_unload(self):
+        # Anything still queued is handed over on !reload, or caught by the next sweep
+        self.flush_departures.cancel()
+        self.reconcile_roster.cancel()
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload):
+        # The raw event also fires for members that weren't in the cache
+        self.departures.setdefault(payload.guild_id, set()).add(payload.user.id)
+        if sum(len(ids) for ids in self.departures.values()) >= FLUSH_THRESHOLD:
+            if self.flush_task is None or self.flush_task.done():
+                self.flush_task = asyncio.create_task(self.flush())
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        # Back before the flush, keep their gear
+        pending = self.departures.get(member.guild.id)
+        if pending:
+            pending.discard(member.id)
+
+    async def remove_members(self, guild_id, discord_ids):
+        # A buffered /add_member written after the delete would bring them back
+        await member_buffer.flush(guild_id)
+        deleted = await member_repo.delete_many(guild_id, discord_ids)
+        if deleted:
+            guild_stats.record_delete(guild_id, deleted)
+            roster_cache.invalidate(guild_id)
+        return deleted
+
+    async def flush(self):
+        """Delete every queued departure, one transaction per guild."""
+        async with self.flush_lock:
+            departures, self.departures = self.departures, {}
+            for guild_id, discord_ids in departures.items():
+                if not discord_ids:
+                    continue
+                try:
+                    deleted = await self.remove_members(guild_id, discord_ids)
+                except DatabaseError as err:
+                    # Put them back so the next flush retries
+                    self.departures.setdefault(guild_id, set()).update(discord_ids)
+                    logger.error(f"Failed to remove departed members of guild {guild_id}: {err}")
+                    continue
+                if deleted:
+                    logger.info(f"Removed {len(deleted)} departed members from the roster of guild {guild_id}")
+
+    @tasks.loop(seconds=30)
+    @telemetry.timed("task")
+    async def flush_departures(self):
+        await self.flush()
+
+    @tasks.loop(hours=6)
+    @telemetry.timed("task")
+    async def reconcile_roster(self):
+        for guild in self.bot.guilds:
+            # An incomplete member cache would make everyone look departed
+            if not guild.chunked:
+                continue
+            try:
+                await member_buffer.flush(guild.id)
+                stale = await member_repo.member_ids(guild.id) - {member.id for member in guild.members}
+                if stale:
+                    deleted = await self.remove_members(guild.id, stale)
+                    logger.info(f"Reconciliation removed {len(deleted)} members who left guild {guild.id}")
+            except DatabaseError as err:
+                logger.error(f"Failed to reconcile the roster of guild {guild.id}: {err}")
+
+    @reconcile_roster.before_loop
+    async def before_reconcile_roster(self):
+        await self.bot.wait_until_ready()
+
+async def setup(bot):
+    await bot.add_cog(RosterCleanup(bot))
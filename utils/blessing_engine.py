@@ -0,0 +1,83 @@
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+UpgradePath = namedtuple("UpgradePath", "base_chance blessing_needed blessing_gained")
+CostSummary = namedtuple("CostSummary", "expected p50 p90 p99 max_cost")
+GambleOption = namedtuple("GambleOption", "attempts success_chance expected_cost max_cost")
+
+# Success chance per attempt, blessing needed for a guaranteed success and blessing gained per failure
+UPGRADE_PATHS = {
+    "green_on_blue": UpgradePath(0.10, 90, 8),
+    "blue_on_purple": UpgradePath(0.10, 450, 40),
+    "green_on_purple": UpgradePath(0.01, 990, 8),
+}
+
+
+@lru_cache(maxsize=None)
+def attempt_distribution(path_name):
+    """
+    Probability that the upgrade succeeds on exactly the 1st, 2nd, ... attempt.
+
+    The upgrade is a Markov chain over the blessing gauge: every failure adds
+    ``blessing_gained`` to the gauge, and once it reaches ``blessing_needed``
+    the next attempt is guaranteed. The probability of still being in the
+    chain after each attempt is the running product of the failure chances,
+    so the whole distribution comes out of one vectorised cumprod.
+    """
+    path = UPGRADE_PATHS[path_name]
+    pity_attempt = math.ceil(path.blessing_needed / path.blessing_gained) + 1
+
+    chances = np.full(pity_attempt, path.base_chance)
+    chances[-1] = 1.0  # Full gauge, guaranteed success
+
+    # survival[i] is the chance that the first i attempts all failed
+    survival = np.concatenate(([1.0], np.cumprod(1.0 - chances)[:-1]))
+    pmf = survival * chances
+    pmf.setflags(write=False)
+    return pmf
+
+
+def _attempts_at(cdf, quantile):
+    # Smallest number of attempts whose cumulative probability reaches the quantile
+    return int(np.searchsorted(cdf, quantile - 1e-12)) + 1
+
+
+@lru_cache(maxsize=1024)
+def cost_summary(path_name, price):
+    """Exact expected cost and cost percentiles for one upgrade path at a given price per attempt."""
+    pmf = attempt_distribution(path_name)
+    attempts = np.arange(1, len(pmf) + 1)
+    cdf = np.cumsum(pmf)
+    return CostSummary(
+        expected=float(price * np.dot(attempts, pmf)),
+        p50=price * _attempts_at(cdf, 0.50),
+        p90=price * _attempts_at(cdf, 0.90),
+        p99=price * _attempts_at(cdf, 0.99),
+        max_cost=price * len(pmf),
+    )
+
+
+@lru_cache(maxsize=1024)
+def gamble_option(path_name, price, gauge_fraction):
+    """
+    Outcome of giving up once the gauge reaches ``gauge_fraction`` of full.
+
+    Returns how many attempts that allows, the chance one of them succeeds
+    and the expected amount spent, which is the price times the expected
+    number of attempts actually made.
+    """
+    path = UPGRADE_PATHS[path_name]
+    pmf = attempt_distribution(path_name)
+    attempts = min(len(pmf), math.ceil(gauge_fraction * path.blessing_needed / path.blessing_gained))
+    cdf = np.cumsum(pmf)
+    # E[min(N, k)] is the sum of the chances of reaching each of the first k attempts
+    survival = np.concatenate(([1.0], 1.0 - cdf[:-1]))
+    return GambleOption(
+        attempts=attempts,
+        success_chance=float(cdf[attempts - 1]),
+        expected_cost=float(price * survival[:attempts].sum()),
+        max_cost=price * attempts,
+    )
@@ -0,0 +1,191 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+
+# All spawn rules are written in server time, the timeline converts them to UTC
+SERVER_TZ_NAME = "Europe/Berlin"
+
+_server_tz = None
+
+
+def server_tz():
+    # pytz is only imported the first time a spawn time is worked out, not at startup
+    global _server_tz
+    if _server_tz is None:
+        import pytz
+        _server_tz = pytz.timezone(SERVER_TZ_NAME)
+    return _server_tz
+
+EVERY_DAY = (0, 1, 2, 3, 4, 5, 6)
+WEDNESDAY, SATURDAY = 2, 5
+
+SpawnRule = namedtuple("SpawnRule", "weekdays hour minute kind info")
+BossEvent = namedtuple("BossEvent", "timestamp time kind info")
+
+# The single source of truth for when bosses spawn
+BOSS_RULES = [
+    SpawnRule(EVERY_DAY, 1, 0, "Normal Boss", "2 Peace Boss, 2 Conflict Boss"),
+    SpawnRule(EVERY_DAY, 13, 0, "Normal Boss", "2 Peace Boss, 1 Conflict Boss"),
+    SpawnRule(EVERY_DAY, 16, 0, "Normal Boss", "2 Peace Boss, 1 Conflict Boss"),
+    SpawnRule(EVERY_DAY, 20, 0, "Normal Boss", "4 Peace Boss, 3 Conflict Boss"),
+    SpawnRule(EVERY_DAY, 22, 0, "Normal Boss", "3 Peace Boss, 2 Conflict Boss"),
+    SpawnRule((WEDNESDAY, SATURDAY), 20, 0, "Archboss", "Archboss"),
+]
+
+# Archbosses step through these states, one step per Archboss spawn. The deployed rotation
+# is read from the archboss_cycle table on startup, this is only used while that is empty.
+ARCHBOSS_CYCLE = ("Conflict", "Peace")
+
+# A known Archboss spawn and its state; every other spawn's state is counted from here.
+# Migration 7 seeds archboss_anchor from the table's active row, admins can move it
+# with /set_archboss_cycle if the rotation drifts. This is only used until that is loaded.
+DEFAULT_ARCHBOSS_ANCHOR = (datetime(2024, 10, 2, 18, 0, tzinfo=timezone.utc), "Conflict")
+
+# Any Monday works as the origin for counting weeks
+_REFERENCE_MONDAY = date(2024, 1, 1)
+
+
+class BossTimeline:
+    """
+    Precomputed, sorted list of upcoming boss spawns.
+
+    The recurring rules are expanded day by day in server time and converted
+    to UTC, so daylight saving changes are handled by pytz rather than by the
+    callers. Lookups are a binary search over the expanded timestamps; the
+    window is rebuilt only when a lookup runs past its end.
+    """
+
+    def __init__(self, rules=BOSS_RULES, tz=None, window_days=14):
+        self.rules = rules
+        self._tz = tz
+        self.window_days = window_days
+        self._start = None
+        self._timestamps = {}
+        self._events = {}
+
+    @property
+    def tz(self):
+        return self._tz or server_tz()
+
+    def _expand(self, start_ts, days):
+        # Start a day early so "after" lookups right at the window edge are covered
+        first_day = datetime.fromtimestamp(start_ts, self.tz).date() - timedelta(days=1)
+        events = []
+        for offset in range(days + 2):
+            day = first_day + timedelta(days=offset)
+            for rule in self.rules:
+                if day.weekday() not in rule.weekdays:
+                    continue
+                local = self.tz.localize(datetime(day.year, day.month, day.day, rule.hour, rule.minute))
+                spawn = local.astimezone(timezone.utc)
+                events.append(BossEvent(spawn.timestamp(), spawn, rule.kind, rule.info))
+        events.sort()
+
+        # Index every kind separately, plus None for "any kind"
+        self._events = {None: events}
+        for event in events:
+            self._events.setdefault(event.kind, []).append(event)
+        self._timestamps = {kind: [event.timestamp for event in kind_events] for kind, kind_events in self._events.items()}
+        self._start = events[0].timestamp if events else start_ts
+
+    def next_events(self, after=None, n=1, kind=None):
+        """Return the next ``n`` spawns strictly after ``after`` (default now), optionally of one kind."""
+        after_ts = (after or datetime.now(timezone.utc)).timestamp()
+        if not any(kind is None or rule.kind == kind for rule in self.rules):
+            return []
+        days = self.window_days
+        rebuilt = False
+        while True:
+            if self._start is not None and self._start <= after_ts:
+                timestamps = self._timestamps.get(kind, [])
+                index = bisect_right(timestamps, after_ts)
+                if index + n <= len(timestamps):
+                    return self._events[kind][index:index + n]
+                if rebuilt:
+                    days *= 2
+            # Not enough events left in the window, rebuild it starting here
+            self._expand(after_ts, days)
+            rebuilt = True
+
+    def next_event(self, after=None, kind=None):
+        events = self.next_events(after, 1, kind)
+        return events[0] if events else None
+
+
+class ArchbossCycle:
+    """
+    Works out whether an Archboss spawn is Peace or Conflict without any database.
+
+    The state of a spawn is found by advancing from the anchor's position in
+    the cycle by the number of Archboss spawns between the anchor and that
+    spawn. That count is plain
+    arithmetic on the weekly rules: whole weeks times spawns per week, plus
+    the spawns already passed in the partial weeks at either end.
+    """
+
+    def __init__(self, cycle=ARCHBOSS_CYCLE, anchor=DEFAULT_ARCHBOSS_ANCHOR, rules=BOSS_RULES, tz=None):
+        self.cycle = tuple(cycle)
+        self._tz = tz
+        # Minutes into the (server time) week of every Archboss spawn
+        self._slots = sorted(
+            weekday * 1440 + rule.hour * 60 + rule.minute
+            for rule in rules if rule.kind == "Archboss"
+            for weekday in rule.weekdays
+        )
+        self._cache = {}
+        self.set_anchor(*anchor)
+
+    def set_cycle(self, cycle):
+        """Use another rotation, e.g. the one stored in archboss_cycle. The anchor keeps its state if it can."""
+        self.cycle = tuple(cycle)
+        self.set_anchor(self.anchor_time, self.anchor_state if self.anchor_state in self.cycle else self.cycle[0])
+
+    def set_anchor(self, anchor_time, state, position=None):
+        """
+        Pin the Archboss spawning at anchor_time to a state. ``position`` is its index in the
+        cycle, needed when a state occurs more than once; the first occurrence by default.
+        """
+        if position is None:
+            if state not in self.cycle:
+                raise ValueError(f"Unknown Archboss state {state!r}")
+            position = self.cycle.index(state)
+        elif not 0 <= position < len(self.cycle) or self.cycle[position] != state:
+            raise ValueError(f"Archboss state {state!r} is not at position {position} of the cycle")
+        self.anchor_time = anchor_time
+        self.anchor_state = state
+        self.anchor_position = position
+        self._anchor_count = None  # Counted on first use
+        self._cache.clear()
+
+    @property
+    def tz(self):
+        return self._tz or server_tz()
+
+    def _spawns_before(self, moment):
+        # Number of Archboss spawns from the reference week up to, but excluding, moment
+        local = moment.astimezone(self.tz).replace(tzinfo=None)
+        weeks = (local.date() - _REFERENCE_MONDAY).days // 7
+        minute_of_week = local.weekday() * 1440 + local.hour * 60 + local.minute + (local.second > 0 or local.microsecond > 0)
+        return weeks * len(self._slots) + bisect_left(self._slots, minute_of_week)
+
+    def position_at(self, spawn_time):
+        """Return the index in the cycle of the Archboss spawning at spawn_time."""
+        if self._anchor_count is None:
+            self._anchor_count = self._spawns_before(self.anchor_time)
+        steps = self._spawns_before(spawn_time) - self._anchor_count
+        return (self.anchor_position + steps) % len(self.cycle)
+
+    def state_at(self, spawn_time):
+        """Return the Peace/Conflict state of the Archboss spawning at spawn_time."""
+        key = spawn_time.timestamp()
+        state = self._cache.get(key)
+        if state is None:
+            state = self.cycle[self.position_at(spawn_time)]
+            if len(self._cache) > 256:
+                self._cache.clear()
+            self._cache[key] = state
+        return state
+
+
+timeline = BossTimeline()
+archboss_cycle = ArchbossCycle()
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+HASH_FILE = os.getenv("COMMAND_TREE_HASH_FILE", ".command_tree_hash")
+
+_synced = False
+
+
+def tree_fingerprint(bot):
+    """
+    SHA-256 of the app-command payload Discord would receive from ``tree.sync()``.
+
+    The application ID is part of it, so switching to another bot token
+    always syncs.
+    """
+    payload = sorted(
+        (command.to_dict(bot.tree) for command in bot.tree.get_commands()),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    raw = json.dumps({"application_id": bot.application_id, "commands": payload}, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _read_hash(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _write_hash(path, fingerprint):
+    with open(path, "w") as f:
+        f.write(fingerprint)
+
+
+async def sync_if_changed(bot, path=HASH_FILE, force=False, once=True):
+    """
+    Sync the global command tree, but only if it changed since the last sync.
+
+    With ``once`` it runs at most once per process, so gateway reconnects
+    cause no sync traffic; a reload passes ``once=False`` to pick up changed
+    commands. Returns True if a sync was sent to Discord.
+    """
+    global _synced
+    if once and _synced and not force:
+        return False
+
+    fingerprint = tree_fingerprint(bot)
+    if not force and fingerprint == _read_hash(path):
+        logger.info("Command tree unchanged since the last sync, skipping sync.")
+        _synced = True
+        return False
+
+    await bot.tree.sync()
+    _synced = True
+    try:
+        _write_hash(path, fingerprint)
+    except OSError as e:
+        # Only costs an extra sync on the next start
+        logger.warning(f"Could not store the command tree hash in {path}: {e}")
+    logger.info(f"Command tree synced (fingerprint {fingerprint[:12]}).")
+    return True
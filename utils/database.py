@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from utils.sql_dialect import MYSQL, SQLITE
+from utils.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseError(Exception):
+    """Raised when a query fails, regardless of the underlying driver."""
+
+
+class _Backend:
+    """
+    Shared query helpers. Subclasses provide ``_call``, which runs
+    ``func(connection, *args)`` on a connection in a worker thread, and the
+    executors reads and writes are sent to.
+    """
+
+    async def _submit(self, executor, func, *args):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, partial(self._call, func, *args))
+        finally:
+            # Includes waiting for a free worker, that is part of what the caller waited on
+            telemetry.add("db", time.perf_counter() - start)
+
+    async def run(self, func, *args):
+        """
+        Run ``func(connection, *args)`` on a connection in a worker thread.
+
+        Use this for anything that needs several statements in one transaction;
+        ``func`` is responsible for committing.
+        """
+        return await self._submit(self._write_executor(), func, *args)
+
+    async def run_read(self, func, *args):
+        """Like ``run`` for functions that only read, which some backends can run in parallel."""
+        return await self._submit(self._read_executor(), func, *args)
+
+    async def fetchone(self, query, params=(), dictionary=True):
+        def _fetchone(connection):
+            cursor = connection.cursor(dictionary=dictionary)
+            try:
+                cursor.execute(query, params)
+                return cursor.fetchone()
+            finally:
+                cursor.close()
+        return await self.run_read(_fetchone)
+
+    async def fetchall(self, query, params=(), dictionary=True):
+        def _fetchall(connection):
+            cursor = connection.cursor(dictionary=dictionary)
+            try:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        return await self.run_read(_fetchall)
+
+    async def execute(self, query, params=()):
+        """Execute a single write statement, commit it and return the affected row count."""
+        def _execute(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, params)
+                connection.commit()
+                return cursor.rowcount
+            finally:
+                cursor.close()
+        return await self.run(_execute)
+
+    async def executemany(self, query, seq_of_params):
+        def _executemany(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.executemany(query, seq_of_params)
+                connection.commit()
+                return cursor.rowcount
+            finally:
+                cursor.close()
+        return await self.run(_executemany)
+
+
+class MySQLBackend(_Backend):
+    """
+    One MySQL connection pool shared by every cog. Queries run on a
+    dedicated thread pool sized to match the connection pool, so a
+    connection is always available for each worker thread.
+    """
+
+    dialect = MYSQL
+
+    def __init__(self, pool_size=8):
+        self.pool_size = pool_size
+        self._pool = None
+        self._executor = None
+
+    @staticmethod
+    def config():
+        # Read lazily so the values from token.env are picked up no matter
+        # when this module is imported.
+        return {
+            "host": os.getenv("DB_HOST"),
+            "user": os.getenv("DB_USER"),
+            "password": os.getenv("DB_PASSWORD"),
+            "database": os.getenv("DB_NAME"),
+        }
+
+    def _get_pool(self):
+        if self._pool is None:
+            from mysql.connector import pooling
+            logger.info(f"Creating database connection pool (size {self.pool_size})")
+            self._pool = pooling.MySQLConnectionPool(
+                pool_name="voidling", pool_size=self.pool_size, pool_reset_session=False, **self.config()
+            )
+        return self._pool
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="db")
+        return self._executor
+
+    # Reads and writes share the pool
+    _write_executor = _read_executor = _get_executor
+
+    def _call(self, func, *args):
+        # Runs on a worker thread: borrow a pooled connection, hand it to func
+        # and always give it back, rolling back anything left uncommitted.
+        import mysql.connector
+        try:
+            connection = self._get_pool().get_connection()
+        except mysql.connector.Error as err:
+            raise DatabaseError(str(err)) from err
+        try:
+            return func(connection, *args)
+        except mysql.connector.Error as err:
+            raise DatabaseError(str(err)) from err
+        finally:
+            # Reads never commit, without this the next borrower would keep reading their
+            # REPEATABLE READ snapshot since the pool doesn't reset sessions
+            try:
+                if connection.in_transaction:
+                    connection.rollback()
+            except mysql.connector.Error as err:
+                logger.warning(f"Failed to roll back a pooled connection: {err}")
+            connection.close()  # Returns the connection to the pool
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._pool = None
+
+
+class _SQLiteCursor:
+    # Gives sqlite3 the small slice of the mysql.connector cursor API the bot uses
+    def __init__(self, cursor, dictionary):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def execute(self, query, params=()):
+        self._cursor.execute(query.replace("%s", "?"), params)
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(query.replace("%s", "?"), seq_of_params)
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, dictionary=False):
+        return _SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+
+class SQLiteBackend(_Backend):
+    """
+    Embedded SQLite database in WAL mode.
+
+    Every write goes through one dedicated writer thread with its own
+    connection, so writes never contend for SQLite's lock, while a few
+    reader threads, each with their own connection, read in parallel from
+    the last committed snapshot.
+    """
+
+    dialect = SQLITE
+
+    def __init__(self, path, readers=4):
+        self.path = path
+        self.readers = readers
+        self._writer = None
+        self._reader_pool = None
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _write_executor(self):
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        return self._writer
+
+    def _read_executor(self):
+        if self._reader_pool is None:
+            self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-reader")
+        return self._reader_pool
+
+    def _connection(self):
+        # One connection per worker thread, opened the first time the thread needs it
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _call(self, func, *args):
+        try:
+            connection = self._connection()
+        except sqlite3.Error as err:
+            raise DatabaseError(str(err)) from err
+        try:
+            return func(_SQLiteConnection(connection), *args)
+        except sqlite3.Error as err:
+            connection.rollback()
+            raise DatabaseError(str(err)) from err
+        finally:
+            # Readers must not keep a transaction open, or they would keep seeing an old snapshot
+            if connection.in_transaction:
+                connection.rollback()
+
+    def close(self):
+        for executor in (self._writer, self._reader_pool):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self._writer = self._reader_pool = None
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+class Database:
+    """
+    Bot-wide data-access layer.
+
+    Every cog shares this one instance. The backend is picked on first use
+    from ``DB_BACKEND``: ``mysql`` (the default) or ``sqlite``, which keeps
+    the database in the file named by ``SQLITE_PATH``. Queries always run in
+    worker threads, so callers can simply ``await`` them without ever
+    blocking the event loop. SQL is written with ``%s`` placeholders;
+    anything else that differs between backends comes from ``dialect``.
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            name = os.getenv("DB_BACKEND", "mysql").lower()
+            if name == "sqlite":
+                path = os.getenv("SQLITE_PATH", "voidling.db")
+                logger.info(f"Using the SQLite database at {path}")
+                self._backend = SQLiteBackend(path)
+            elif name == "mysql":
+                self._backend = MySQLBackend()
+            else:
+                raise ValueError(f"Unknown DB_BACKEND {name!r}, expected 'mysql' or 'sqlite'")
+        return self._backend
+
+    @property
+    def dialect(self):
+        return self.backend.dialect
+
+    async def run(self, func, *args):
+        return await self.backend.run(func, *args)
+
+    async def run_read(self, func, *args):
+        return await self.backend.run_read(func, *args)
+
+    async def fetchone(self, query, params=(), dictionary=True):
+        return await self.backend.fetchone(query, params, dictionary)
+
+    async def fetchall(self, query, params=(), dictionary=True):
+        return await self.backend.fetchall(query, params, dictionary)
+
+    async def execute(self, query, params=()):
+        return await self.backend.execute(query, params)
+
+    async def executemany(self, query, seq_of_params):
+        return await self.backend.executemany(query, seq_of_params)
+
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
+
+
+# The single shared instance every cog should use
+db = Database()
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+
+class DMQueue:
+    """
+    Bounded background queue for direct messages.
+
+    A single worker sends one DM every ``interval`` seconds, so a join storm
+    turns into a steady trickle instead of a burst of API calls. Queuing a
+    second DM from the same server for someone who is still waiting replaces
+    the first one, and
+    once ``maxsize`` people are waiting new DMs are dropped rather than
+    piling up. A 429 response is retried after the delay Discord asks for.
+    """
+
+    def __init__(self, maxsize=200, interval=1.0, max_retries=3):
+        self.maxsize = maxsize
+        self.interval = interval
+        self.max_retries = max_retries
+        self.sent = 0
+        self.dropped = 0
+        self._pending = OrderedDict()  # (guild id, user id) -> (user, content), oldest first
+        self._ready = asyncio.Event()
+        self._worker = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run(), name="dm-queue")
+
+    def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def enqueue(self, user, content, guild_id=None):
+        """Queue a DM on behalf of a server. Returns False if it was dropped because the queue is full."""
+        key = (guild_id, user.id)
+        if key in self._pending:
+            # Coalesce: keep their place in line but send the newest content
+            self._pending[key] = (user, content)
+            return True
+        if len(self._pending) >= self.maxsize:
+            self.dropped += 1
+            logger.warning(f"DM queue full ({self.maxsize}), dropping DM to {user} ({self.dropped} dropped so far)")
+            return False
+        self._pending[key] = (user, content)
+        self._ready.set()
+        return True
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._ready.clear()
+                await self._ready.wait()
+            _, (user, content) = self._pending.popitem(last=False)
+            await self._send(user, content)
+            await asyncio.sleep(self.interval)
+
+    async def _send(self, user, content):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await user.send(content)
+                self.sent += 1
+                return
+            except discord.Forbidden:
+                logger.warning(f"Unable to DM {user}, maybe they have DMs disabled.")
+                return
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == self.max_retries:
+                    logger.error(f"Failed to DM {user}: {e}")
+                    return
+                retry_after = float(e.response.headers.get("Retry-After", 2 ** attempt))
+                logger.warning(f"Rate limited while DMing {user}, retrying in {retry_after:.1f}s")
+                await asyncio.sleep(retry_after)
+            except Exception:
+                # e.g. a dropped connection or a timeout, which must not end the worker
+                logger.exception(f"Failed to DM {user}")
+                return
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second with bursts of up to ``capacity``."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Delivery:
+    """
+    One message to deliver.
+
+    ``route`` identifies the Discord rate-limit bucket the request falls into
+    (for channel messages that is the channel ID), ``scheduled_at`` is the
+    UNIX timestamp the message was meant to go out at and ``send`` is a
+    zero-argument coroutine function doing the actual API call.
+    """
+
+    __slots__ = ("guild_id", "route", "scheduled_at", "send")
+
+    def __init__(self, guild_id, route, scheduled_at, send):
+        self.guild_id = guild_id
+        self.route = route
+        self.scheduled_at = scheduled_at
+        self.send = send
+
+
+class FanoutDispatcher:
+    """
+    Delivers a batch of messages concurrently.
+
+    At most ``max_concurrency`` sends are in flight at once, requests that
+    share a route are sent one after another so they don't trip that route's
+    bucket, and all sends together stay below ``global_rate`` per second,
+    under Discord's global limit. The delay between each delivery's scheduled
+    time and the moment it actually went out is recorded per guild.
+    """
+
+    def __init__(self, max_concurrency=10, global_rate=40, history=20):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._global_bucket = TokenBucket(global_rate)
+        self._route_locks = {}  # route -> (lock, number of deliveries holding or waiting for it)
+        self.latencies = defaultdict(lambda: deque(maxlen=history))  # guild_id -> recent delays in seconds
+
+    async def dispatch(self, deliveries):
+        """Send every delivery and return the number that succeeded."""
+        deliveries = list(deliveries)
+        if not deliveries:
+            return 0
+        started = time.monotonic()
+        results = await asyncio.gather(*(self._deliver(delivery) for delivery in deliveries))
+        delays = sorted(delay for delay in results if delay is not None)
+        if delays:
+            logger.info(
+                f"Delivered {len(delays)}/{len(deliveries)} messages in {time.monotonic() - started:.2f}s "
+                f"(delay median {delays[len(delays) // 2]:.2f}s, max {delays[-1]:.2f}s)"
+            )
+        return len(delays)
+
+    @asynccontextmanager
+    async def _route(self, route):
+        # One lock per route while deliveries use it, dropped with the last one so idle channels don't pile up
+        lock, users = self._route_locks.get(route, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._route_locks[route] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._route_locks[route]
+            if users == 1:
+                del self._route_locks[route]
+            else:
+                self._route_locks[route] = (lock, users - 1)
+
+    async def _deliver(self, delivery):
+        # Wait for the route first so queued sends to a busy channel don't hold a concurrency slot
+        async with self._route(delivery.route):
+            async with self._semaphore:
+                await self._global_bucket.acquire()
+                try:
+                    await delivery.send()
+                except Exception:
+                    logger.exception(f"Delivery to guild {delivery.guild_id} (route {delivery.route}) failed")
+                    return None
+        delay = max(0.0, time.time() - delivery.scheduled_at)
+        self.latencies[delivery.guild_id].append(delay)
+        return delay
+
+    def latency_summary(self):
+        """Return ``(guild_id, last_delay, worst_delay)`` for every guild, worst first."""
+        summary = [
+            (guild_id, delays[-1], max(delays))
+            for guild_id, delays in self.latencies.items() if delays
+        ]
+        return sorted(summary, key=lambda row: row[2], reverse=True)
@@ -0,0 +1,61 @@
+"""
+Gear score history helpers.
+
+Every gear score change is stored as a delta against the member's previous
+score, keyed by guild and week (see migration 6), so a member's score at any
+point is the running sum of their deltas. Guild-wide progression is read from
+``gear_score_weekly``, rolled up from the roster once an hour.
+"""
+from datetime import datetime, timezone
+
+# Weeks are numbered from the Monday before the Unix epoch (a Thursday)
+EPOCH_WEEKDAY_OFFSET = 3
+SPARKS = "▁▂▃▄▅▆▇█"
+
+
+def week_of(timestamp):
+    """Week number of a Unix timestamp, weeks start on Monday 00:00 UTC."""
+    return (int(timestamp) // 86400 + EPOCH_WEEKDAY_OFFSET) // 7
+
+
+def week_start(week):
+    """The Monday a week number starts on."""
+    return datetime.fromtimestamp((week * 7 - EPOCH_WEEKDAY_OFFSET) * 86400, timezone.utc).date()
+
+
+def rollup(scores):
+    """
+    Weekly aggregate of one guild's gear scores: (members, average, median,
+    top_decile). ``top_decile`` is the score needed to be in the top 10%.
+    """
+    scores = sorted(scores)
+    count = len(scores)
+    middle = count // 2
+    median = scores[middle] if count % 2 else (scores[middle - 1] + scores[middle]) / 2
+    # Nearest-rank 90th percentile, at most 10% of the guild scores higher
+    top_decile = scores[-(-count * 9 // 10) - 1]
+    return count, round(sum(scores) / count), round(median), top_decile
+
+
+def weekly_scores(events):
+    """
+    Fold a member's ``(recorded_at, delta)`` events, oldest first, into
+    ``[(week, score)]`` with the score they ended each week on.
+    """
+    series = []
+    score = 0
+    for recorded_at, delta in events:
+        score += delta
+        week = week_of(recorded_at / 1000)
+        if series and series[-1][0] == week:
+            series[-1] = (week, score)
+        else:
+            series.append((week, score))
+    return series
+
+
+def sparkline(values):
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARKS[len(SPARKS) // 2] * len(values)
+    return "".join(SPARKS[round((value - low) / (high - low) * (len(SPARKS) - 1))] for value in values)
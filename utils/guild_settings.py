@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import os
+import time
+
+from utils.database import DatabaseError
+from utils.repositories import settings_repo
+
+logger = logging.getLogger(__name__)
+
+# Minutes before a spawn that reminders go out when a guild hasn't chosen otherwise
+DEFAULT_LEAD_MINUTES = 15
+
+
+class GuildSettingsCache:
+    """
+    Process-wide, write-through cache of the ``guild_settings`` table.
+
+    The whole table is loaded with one query the first time it is needed and
+    every write made through :meth:`set` updates the cache as well as the
+    database, so reads never touch the database in steady state. If ``ttl`` is
+    set the table is reloaded in bulk once the cached copy is older than that
+    many seconds, which picks up edits made outside the bot. ``generation``
+    goes up with every successful load so consumers can tell when to resync.
+    """
+
+    retry_delay = 30  # Seconds to wait before retrying a failed load
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._settings = {}
+        self._loaded_at = None
+        self.generation = 0
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self):
+        """False until the table has been loaded successfully at least once."""
+        return self._loaded_at is not None
+
+    def _is_fresh(self):
+        if self._loaded_at is None:
+            return False
+        return self.ttl is None or time.monotonic() - self._loaded_at < self.ttl
+
+    async def warm(self):
+        """(Re)load every guild's settings with a single query."""
+        try:
+            rows = await settings_repo.all()
+        except DatabaseError as e:
+            # Keep serving the last known settings and don't hammer the database
+            logger.error(f"Failed to load guild settings: {e}")
+            self._retry_at = time.monotonic() + self.retry_delay
+            return
+        self._settings = {
+            row["guild_id"]: {
+                "channel_id": row["channel_id"],
+                "role_id": row["role_id"],
+                "lead_minutes": row["lead_minutes"] or DEFAULT_LEAD_MINUTES,
+            }
+            for row in rows
+        }
+        self._loaded_at = time.monotonic()
+        self.generation += 1
+        logger.info(f"Loaded settings for {len(self._settings)} guilds")
+
+    async def ensure_loaded(self):
+        if self._is_fresh() or time.monotonic() < self._retry_at:
+            return
+        async with self._lock:
+            # Another caller may have finished loading while we waited
+            if not self._is_fresh():
+                await self.warm()
+
+    async def get(self, guild_id):
+        """Return ``{"channel_id", "role_id", "lead_minutes"}`` for the guild, or None if it has no settings."""
+        await self.ensure_loaded()
+        return self._settings.get(guild_id)
+
+    async def get_all(self):
+        """Return a snapshot of every guild's settings keyed by guild ID."""
+        await self.ensure_loaded()
+        return dict(self._settings)
+
+    async def set(self, guild_id, channel_id, role_id, lead_minutes=DEFAULT_LEAD_MINUTES):
+        """Persist the settings and update the cache. Raises DatabaseError if the write fails."""
+        await settings_repo.save(guild_id, channel_id, role_id, lead_minutes)
+        self._settings[guild_id] = {"channel_id": channel_id, "role_id": role_id, "lead_minutes": lead_minutes}
+
+
+def _ttl_from_env():
+    value = os.getenv("GUILD_SETTINGS_TTL")
+    return float(value) if value else None
+
+
+guild_settings = GuildSettingsCache(ttl=_ttl_from_env())
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections import Counter
+
+from utils.repositories import member_repo
+
+logger = logging.getLogger(__name__)
+
+
+class GuildAggregate:
+    """Running totals for one guild's roster."""
+
+    __slots__ = ("count", "gear_total", "classes", "weapon_combos")
+
+    def __init__(self):
+        self.count = 0
+        self.gear_total = 0
+        self.classes = Counter()
+        self.weapon_combos = Counter()  # Keyed by the sorted (weapon, weapon) pair
+
+    def apply(self, member, sign=1):
+        """Add (sign=1) or remove (sign=-1) one guild_members row."""
+        self.count += sign
+        self.gear_total += sign * member['gear_score']
+        self.classes[member['class']] += sign
+        self.weapon_combos[tuple(sorted((member['main_hand'], member['offhand'])))] += sign
+
+    @property
+    def average_gear_score(self):
+        return round(self.gear_total / self.count) if self.count else 0
+
+
+class GuildStatsStore:
+    """
+    Per-guild roster statistics kept up to date incrementally.
+
+    A guild's aggregate is built with a handful of GROUP BY queries the first
+    time it is requested. After that every write to guild_members reports the
+    old and new rows here, so reading the stats never touches the roster.
+    :meth:`reconcile` rebuilds the loaded aggregates from the database to
+    correct any drift, e.g. from edits made outside the bot.
+
+    Every reported write bumps the guild's version. A load that saw the
+    version change while it ran may have missed that write, so its result
+    is not cached.
+    """
+
+    # Loads retried by get() before it answers from an uncached aggregate
+    load_attempts = 3
+
+    def __init__(self):
+        self._guilds = {}
+        self._locks = {}
+        self._versions = {}
+
+    def _bump(self, guild_id):
+        self._versions[guild_id] = self._versions.get(guild_id, 0) + 1
+
+    async def get(self, guild_id):
+        aggregate = self._guilds.get(guild_id)
+        if aggregate is not None:
+            return aggregate
+        lock = self._locks.setdefault(guild_id, asyncio.Lock())
+        async with lock:
+            aggregate = self._guilds.get(guild_id)
+            for _ in range(self.load_attempts if aggregate is None else 0):
+                version = self._versions.get(guild_id, 0)
+                aggregate = await self._load(guild_id)
+                if self._versions.get(guild_id, 0) == version:
+                    self._guilds[guild_id] = aggregate
+                    break
+        return aggregate
+
+    async def _load(self, guild_id):
+        totals, classes, combos = await member_repo.aggregate(guild_id)
+        aggregate = GuildAggregate()
+        aggregate.count = int(totals['count'])
+        aggregate.gear_total = int(totals['gear_total'])
+        for row in classes:
+            aggregate.classes[row['class']] = row['count']
+        for row in combos:
+            aggregate.weapon_combos[tuple(sorted((row['main_hand'], row['offhand'])))] += row['count']
+        return aggregate
+
+    def record_upsert(self, guild_id, old_member, new_member):
+        """Apply a REPLACE INTO: old_member is the row it replaced, or None for a new member."""
+        self._bump(guild_id)
+        aggregate = self._guilds.get(guild_id)
+        if aggregate is None:
+            return  # Not loaded yet, the first read will see the new row anyway
+        if old_member:
+            aggregate.apply(old_member, -1)
+        aggregate.apply(new_member, 1)
+
+    def record_delete(self, guild_id, members):
+        self._bump(guild_id)
+        aggregate = self._guilds.get(guild_id)
+        if aggregate is None:
+            return
+        for member in members:
+            aggregate.apply(member, -1)
+
+    def invalidate(self, guild_id):
+        """Forget a guild's aggregate after a bulk write, the next read rebuilds it."""
+        self._bump(guild_id)
+        self._guilds.pop(guild_id, None)
+
+    async def reconcile(self):
+        """Rebuild every loaded aggregate from the database."""
+        for guild_id, cached in list(self._guilds.items()):
+            version = self._versions.get(guild_id, 0)
+            fresh = await self._load(guild_id)
+            # Written to, invalidated or rebuilt while we were loading, fresh may already be behind
+            if self._versions.get(guild_id, 0) != version or self._guilds.get(guild_id) is not cached:
+                continue
+            if (fresh.count, fresh.gear_total) != (cached.count, cached.gear_total):
+                logger.warning(f"Guild stats for {guild_id} had drifted, reconciled from the database")
+            self._guilds[guild_id] = fresh
+
+
+# Written by the roster commands and read by /guild_stats
+guild_stats = GuildStatsStore()
@@ -0,0 +1,172 @@
+import contextvars
+import glob
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Command and guild of the handler currently running, attached to every record it logs
+_log_context = contextvars.ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields such as ``command`` and ``guild_id`` to everything logged inside the block."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    # Runs in the thread that logged, where the context variable is still visible
+    def filter(self, record):
+        for key, value in _log_context.get().items():
+            setattr(record, key, value)
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without ever blocking the caller.
+
+    When the queue is full the record is dropped and counted; the count is
+    logged once the writer catches up.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            warning = logging.LogRecord(__name__, logging.WARNING, __file__, 0, f"Log queue was full, dropped {dropped} records", None, None)
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.dropped += dropped
+
+
+class RotatingLogFile(logging.handlers.BaseRotatingHandler):
+    """
+    Log file rotated when it reaches ``max_bytes`` or is ``interval`` seconds
+    old, whichever comes first.
+
+    Rotated segments are renamed with a timestamp, gzipped, and only the
+    newest ``backup_count`` are kept. All of this runs on the writer thread.
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, interval=24 * 3600, backup_count=14, compress=True):
+        super().__init__(filename, "a", encoding="utf-8", delay=False)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.compress = compress
+        # A file left over from a previous run counts from when it was last written
+        started = os.path.getmtime(self.baseFilename) if os.path.getsize(self.baseFilename) else time.time()
+        self.rollover_at = started + interval
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        if self.max_bytes and self.stream is not None:
+            return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            # Microseconds keep two size rollovers in the same second apart
+            segment = f"{self.baseFilename}.{datetime.now(timezone.utc):%Y%m%d-%H%M%S-%f}"
+            os.rename(self.baseFilename, segment)
+            if self.compress:
+                with open(segment, "rb") as source, gzip.open(segment + ".gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(segment)
+            self._prune()
+        self.stream = self._open()
+        self.rollover_at = time.time() + self.interval
+
+    def _prune(self):
+        # Timestamps sort lexically, so the oldest segments come first
+        segments = sorted(glob.glob(glob.escape(self.baseFilename) + ".*"))
+        for old in segments[:-self.backup_count] if self.backup_count else []:
+            os.remove(old)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line, including the command and guild context when there is one."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("command", "guild_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    # The plain format, with the command and guild appended when there is one
+    def format(self, record):
+        line = super().format(record)
+        context = [f"{key}={getattr(record, key)}" for key in ("command", "guild_id") if getattr(record, key, None) is not None]
+        return f"{line} [{' '.join(context)}]" if context else line
+
+
+def setup_logging():
+    """
+    Route every log record through a queue to a background writer thread.
+
+    Configured from the environment: LOG_FILE (default bot_logs.txt),
+    LOG_LEVEL (INFO), LOG_FORMAT (text or json), LOG_MAX_BYTES,
+    LOG_ROTATE_HOURS and LOG_BACKUPS. Returns the started QueueListener,
+    stop it on shutdown to flush what is still queued.
+    """
+    file_handler = RotatingLogFile(
+        os.getenv("LOG_FILE", "bot_logs.txt"),
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        interval=float(os.getenv("LOG_ROTATE_HOURS", 24)) * 3600,
+        backup_count=int(os.getenv("LOG_BACKUPS", 14)),
+    )
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        file_handler.setFormatter(JsonLinesFormatter())
+    else:
+        file_handler.setFormatter(TextFormatter(TEXT_FORMAT))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=10000))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
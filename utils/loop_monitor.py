@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+COGS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cogs")
+
+
+class StallReport:
+    """A single event-loop stall captured by the watchdog thread."""
+
+    def __init__(self, started_at, task_name, location, stack):
+        self.started_at = started_at
+        self.task_name = task_name
+        self.location = location
+        self.stack = stack
+        self.duration = None  # Filled in once the loop starts ticking again
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs scheduled callbacks.
+
+    A heartbeat coroutine sleeps for ``interval`` seconds and records how much
+    later than requested it woke up. A separate watchdog thread notices when
+    the heartbeat has not ticked for ``stall_threshold`` seconds, which means
+    something is blocking the loop, and captures the loop thread's stack while
+    the blocking call is still running.
+    """
+
+    def __init__(self, interval=0.25, stall_threshold=0.5, window=2400, max_reports=20):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.samples = deque(maxlen=window)  # Roughly the last 10 minutes at the default interval
+        self.stalls = deque(maxlen=max_reports)
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+        self._current_stall = None
+        self._heartbeat_task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._heartbeat_task is not None and not self._heartbeat_task.done()
+
+    def start(self):
+        """Start monitoring the running loop. Must be called from the loop thread."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat(), name="loop-monitor-heartbeat")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        self._watchdog = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            self._last_beat = time.monotonic()
+
+            stall = self._current_stall
+            if stall is not None:
+                self._current_stall = None
+                stall.duration = lag + self.interval
+                logger.warning(
+                    f"Event loop was blocked for {stall.duration * 1000:.0f}ms "
+                    f"in {stall.task_name} at {stall.location}"
+                )
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            if self._current_stall is not None:
+                continue
+            blocked_for = time.monotonic() - self._last_beat
+            if blocked_for < self.stall_threshold:
+                continue
+            report = self._capture()
+            if report is None:
+                continue
+            self._current_stall = report
+            self.stalls.append(report)
+            logger.warning(
+                f"Event loop stalled for more than {self.stall_threshold * 1000:.0f}ms "
+                f"in {report.task_name} at {report.location}\n{''.join(report.stack)}"
+            )
+
+    def _capture(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = traceback.format_stack(frame)
+
+        # The innermost frame inside a cog is usually the command or listener to blame
+        location = "unknown"
+        current = frame
+        while current is not None:
+            if current.f_code.co_filename.startswith(COGS_DIR):
+                location = (
+                    f"{os.path.basename(current.f_code.co_filename)}:"
+                    f"{current.f_code.co_name} (line {current.f_lineno})"
+                )
+                break
+            current = current.f_back
+
+        # discord.py names listener tasks after the event, e.g. "discord.py: on_member_join"
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        task_name = task.get_name() if task is not None else "loop callback"
+        return StallReport(datetime.now(timezone.utc), task_name, location, stack)
+
+    def percentiles(self, points=(50, 95, 99)):
+        """Return the requested lag percentiles in seconds over the rolling window."""
+        if not self.samples:
+            return {point: 0.0 for point in points}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {point: ordered[min(last, round(point / 100 * last))] for point in points}
+
+    def max_lag(self):
+        return max(self.samples, default=0.0)
+
+
+# Started by the diagnostics cog
+monitor = LoopMonitor()
@@ -0,0 +1,88 @@
+import math
+import time
+from collections import deque, namedtuple
+
+from utils.loop_monitor import monitor
+
+Sample = namedtuple("Sample", "taken_at cpu_percent rss_bytes loop_lag gateway_latency")
+
+
+class EntityCounts:
+    """
+    Guild, member and channel totals across every server the bot is in.
+
+    Recounted once per READY from the guild cache and then adjusted from
+    gateway events, so reading them never walks the member or channel lists.
+    Members are summed per guild, someone in two servers counts twice.
+    """
+
+    def __init__(self):
+        self.guilds = 0
+        self.members = 0
+        self.channels = 0
+
+    def recount(self, guilds):
+        self.guilds = len(guilds)
+        self.members = sum(guild.member_count or 0 for guild in guilds)
+        self.channels = sum(len(guild.channels) for guild in guilds)
+
+    def add_guild(self, guild, sign=1):
+        self.guilds += sign
+        self.members += sign * (guild.member_count or 0)
+        self.channels += sign * len(guild.channels)
+
+
+class MetricsSampler:
+    """
+    Fixed-size ring buffer of process and bot health samples.
+
+    ``sample`` is meant to be called on a fixed interval, by default once a
+    minute with 60 slots, so the buffer always covers the last hour.
+    """
+
+    def __init__(self, size=60):
+        self.samples = deque(maxlen=size)
+        self.counts = EntityCounts()
+        self.started_at = time.time()
+        self._process = None
+
+    def _get_process(self):
+        if self._process is None:
+            # Imported on first use so it doesn't slow down startup
+            import psutil
+            self._process = psutil.Process()
+            # The first reading is always 0.0, later ones cover the time since the previous call
+            self._process.cpu_percent(None)
+        return self._process
+
+    def start(self):
+        """Start measuring CPU time now, so the first sample covers a full interval."""
+        self._get_process()
+
+    def sample(self, bot):
+        latency = bot.latency
+        lag = monitor.percentiles((99,))[99]
+        primed = self._process is not None
+        process = self._get_process()
+        self.samples.append(Sample(
+            taken_at=time.time(),
+            # Without an earlier call there is no interval to measure, record no value rather than 0.0
+            cpu_percent=process.cpu_percent(None) if primed else None,
+            rss_bytes=process.memory_info().rss,
+            loop_lag=lag,
+            gateway_latency=latency if math.isfinite(latency) else None,
+        ))
+
+    @property
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    def summary(self, field):
+        """(min, avg, max) of one Sample field over the buffer, or None without data."""
+        values = [getattr(s, field) for s in self.samples if getattr(s, field) is not None]
+        if not values:
+            return None
+        return min(values), sum(values) / len(values), max(values)
+
+
+sampler = MetricsSampler()
@@ -0,0 +1,377 @@
+import logging
+import time
+
+from utils.boss_timeline import timeline
+from utils.database import db
+from utils.gear_history import week_of
+
+logger = logging.getLogger(__name__)
+
+WEAPON_ENUM = "ENUM('Staff', 'Dagger', 'SwordAndShield', 'Greatsword', 'Long Bow', 'Crossbow', 'WandAndTome')"
+
+
+def add_column(table, column, definition):
+    """Migration step adding a column unless an older manual setup already has it."""
+    def step(cursor):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+            (table, column)
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def add_index(table, name, columns):
+    """Migration step creating an index unless it already exists."""
+    def step(cursor):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+            (table, name)
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+    return step
+
+
+def seed_gear_history(cursor):
+    """Migration step recording everyone's current gear score as the start of their history."""
+    now = time.time()
+    cursor.execute(
+        "INSERT INTO gear_score_events (guild_id, week, discord_id, recorded_at, delta) "
+        "SELECT guild_id, %s, discord_id, %s, gear_score FROM guild_members WHERE gear_score IS NOT NULL AND gear_score <> 0",
+        (week_of(now), int(now * 1000))
+    )
+
+
+def seed_archboss_anchor(cursor):
+    """Migration step pinning the Archboss rotation to the active archboss_cycle row, unless an admin already has."""
+    cursor.execute("SELECT COUNT(*) FROM archboss_anchor")
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute("SELECT cycle_state, status FROM archboss_cycle ORDER BY id")
+    rows = cursor.fetchall()
+    active = [position for position, (state, status) in enumerate(rows) if status == 1]
+    if not active:
+        return
+    # The active row is the state of the next Archboss, the old bot moved it on once that spawn had passed
+    position = active[0]
+    spawn = timeline.next_event(kind="Archboss").time
+    cursor.execute(
+        "INSERT INTO archboss_anchor (id, anchor_time, cycle_state, cycle_position) VALUES (1, %s, %s, %s)",
+        (int(spawn.timestamp()), rows[position][0], position)
+    )
+
+
+# Append only: each entry is (version, description, steps). A step is either a SQL
+# string or a callable taking a cursor. Never edit a migration that has shipped.
+MIGRATIONS = [
+    (1, "Create base tables", [
+        f'''
+        CREATE TABLE IF NOT EXISTS guild_members (
+            discord_id BIGINT,
+            guild_id BIGINT,
+            ingame_name VARCHAR(255),
+            gear_score INT,
+            class ENUM('Healer', 'DPS', 'Tank'),
+            main_hand {WEAPON_ENUM},
+            offhand {WEAPON_ENUM},
+            PRIMARY KEY (discord_id, guild_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id BIGINT PRIMARY KEY,
+            channel_id BIGINT,
+            role_id BIGINT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS welcome_messages (
+            guild_id BIGINT PRIMARY KEY,
+            message TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS archboss_anchor (
+            id TINYINT PRIMARY KEY,
+            anchor_time BIGINT NOT NULL,
+            cycle_state VARCHAR(16) NOT NULL
+        )
+        ''',
+    ]),
+    (2, "Per-guild reminder lead time", [
+        add_column("guild_settings", "lead_minutes", "INT NOT NULL DEFAULT 15"),
+    ]),
+    (3, "Guild-first indexes for guild_members", [
+        # Serves the roster ordered by gear score and its keyset pagination
+        add_index("guild_members", "idx_guild_gear", "guild_id, gear_score, discord_id"),
+        # Serves lookups by in-game name within a guild
+        add_index("guild_members", "idx_guild_name", "guild_id, ingame_name"),
+    ]),
+    (4, "Persisted drop posts and their votes", [
+        '''
+        CREATE TABLE IF NOT EXISTS drop_posts (
+            message_id BIGINT PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            items TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_drop_posts_created (created_at)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS drop_votes (
+            message_id BIGINT,
+            item_index TINYINT,
+            user_id BIGINT,
+            PRIMARY KEY (message_id, item_index, user_id)
+        )
+        ''',
+    ]),
+    (5, "Persisted weekly boss votes", [
+        '''
+        CREATE TABLE IF NOT EXISTS boss_vote_posts (
+            message_id BIGINT PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_boss_vote_posts_created (created_at)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS boss_votes (
+            message_id BIGINT,
+            user_id BIGINT,
+            boss VARCHAR(64),
+            PRIMARY KEY (message_id, user_id, boss)
+        )
+        ''',
+    ]),
+    (6, "Gear score history", [
+        # One row per change holding the difference to the previous score. Clustered by
+        # guild and week, so a guild's history is stored together in time order
+        '''
+        CREATE TABLE IF NOT EXISTS gear_score_events (
+            guild_id BIGINT NOT NULL,
+            week INT NOT NULL,
+            discord_id BIGINT NOT NULL,
+            recorded_at BIGINT NOT NULL,
+            delta INT NOT NULL,
+            PRIMARY KEY (guild_id, week, discord_id, recorded_at),
+            INDEX idx_gear_events_member (guild_id, discord_id, recorded_at)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS gear_score_weekly (
+            guild_id BIGINT NOT NULL,
+            week INT NOT NULL,
+            members INT NOT NULL,
+            average INT NOT NULL,
+            median INT NOT NULL,
+            top_decile INT NOT NULL,
+            PRIMARY KEY (guild_id, week)
+        )
+        ''',
+        seed_gear_history,
+    ]),
+    (7, "Archboss rotation from archboss_cycle", [
+        # Older deployments created this table by hand with one row per step, new ones start empty
+        '''
+        CREATE TABLE IF NOT EXISTS archboss_cycle (
+            id INT PRIMARY KEY,
+            cycle_state VARCHAR(16) NOT NULL,
+            status TINYINT NOT NULL DEFAULT 0
+        )
+        ''',
+        add_column("archboss_anchor", "cycle_position", "INT"),
+        seed_archboss_anchor,
+    ]),
+]
+
+
+def sqlite_check(column, values):
+    """SQLite has no ENUM, a CHECK constraint keeps the column to the same values."""
+    return f"TEXT CHECK ({column} IN ({', '.join(repr(value) for value in values)}))"
+
+
+WEAPONS = ('Staff', 'Dagger', 'SwordAndShield', 'Greatsword', 'Long Bow', 'Crossbow', 'WandAndTome')
+
+# The same schema for the SQLite backend, version for version. Every new
+# migration is added to both lists.
+SQLITE_MIGRATIONS = [
+    (1, "Create base tables", [
+        f'''
+        CREATE TABLE IF NOT EXISTS guild_members (
+            discord_id INTEGER,
+            guild_id INTEGER,
+            ingame_name TEXT,
+            gear_score INTEGER,
+            class {sqlite_check('class', ('Healer', 'DPS', 'Tank'))},
+            main_hand {sqlite_check('main_hand', WEAPONS)},
+            offhand {sqlite_check('offhand', WEAPONS)},
+            PRIMARY KEY (discord_id, guild_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            role_id INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS welcome_messages (
+            guild_id INTEGER PRIMARY KEY,
+            message TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS archboss_anchor (
+            id INTEGER PRIMARY KEY,
+            anchor_time INTEGER NOT NULL,
+            cycle_state TEXT NOT NULL
+        )
+        ''',
+    ]),
+    (2, "Per-guild reminder lead time", [
+        "ALTER TABLE guild_settings ADD COLUMN lead_minutes INTEGER NOT NULL DEFAULT 15",
+    ]),
+    (3, "Guild-first indexes for guild_members", [
+        "CREATE INDEX IF NOT EXISTS idx_guild_gear ON guild_members (guild_id, gear_score, discord_id)",
+        "CREATE INDEX IF NOT EXISTS idx_guild_name ON guild_members (guild_id, ingame_name)",
+    ]),
+    (4, "Persisted drop posts and their votes", [
+        '''
+        CREATE TABLE IF NOT EXISTS drop_posts (
+            message_id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            items TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_drop_posts_created ON drop_posts (created_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS drop_votes (
+            message_id INTEGER,
+            item_index INTEGER,
+            user_id INTEGER,
+            PRIMARY KEY (message_id, item_index, user_id)
+        )
+        ''',
+    ]),
+    (5, "Persisted weekly boss votes", [
+        '''
+        CREATE TABLE IF NOT EXISTS boss_vote_posts (
+            message_id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_boss_vote_posts_created ON boss_vote_posts (created_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS boss_votes (
+            message_id INTEGER,
+            user_id INTEGER,
+            boss TEXT,
+            PRIMARY KEY (message_id, user_id, boss)
+        )
+        ''',
+    ]),
+    (6, "Gear score history", [
+        '''
+        CREATE TABLE IF NOT EXISTS gear_score_events (
+            guild_id INTEGER NOT NULL,
+            week INTEGER NOT NULL,
+            discord_id INTEGER NOT NULL,
+            recorded_at INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, week, discord_id, recorded_at)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_gear_events_member ON gear_score_events (guild_id, discord_id, recorded_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS gear_score_weekly (
+            guild_id INTEGER NOT NULL,
+            week INTEGER NOT NULL,
+            members INTEGER NOT NULL,
+            average INTEGER NOT NULL,
+            median INTEGER NOT NULL,
+            top_decile INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, week)
+        ) WITHOUT ROWID
+        ''',
+        seed_gear_history,
+    ]),
+    (7, "Archboss rotation from archboss_cycle", [
+        '''
+        CREATE TABLE IF NOT EXISTS archboss_cycle (
+            id INTEGER PRIMARY KEY,
+            cycle_state TEXT NOT NULL,
+            status INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "ALTER TABLE archboss_anchor ADD COLUMN cycle_position INTEGER",
+        seed_archboss_anchor,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_migrated = False
+
+
+def _apply_pending(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(db.dialect.table_exists(), ("schema_version",))
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                '''
+                CREATE TABLE schema_version (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255),
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                '''
+            )
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = cursor.fetchone()[0]
+
+        applied = []
+        migrations = SQLITE_MIGRATIONS if db.dialect.name == "sqlite" else MIGRATIONS
+        for version, description, steps in migrations:
+            if version <= current:
+                continue
+            logger.info(f"Applying migration {version}: {description}")
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            # MySQL commits DDL implicitly, so record each version as soon as it's done
+            cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)", (version, description))
+            connection.commit()
+            applied.append(version)
+        return applied
+    finally:
+        cursor.close()
+
+
+async def migrate():
+    """
+    Bring the schema up to LATEST_VERSION.
+
+    Runs at most once per process; when the database is already current it
+    costs two small queries and no DDL.
+    """
+    global _migrated
+    if _migrated:
+        return []
+    applied = await db.run(_apply_pending)
+    _migrated = True
+    if applied:
+        logger.info(f"Database schema migrated to version {LATEST_VERSION}")
+    return applied
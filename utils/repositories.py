@@ -0,0 +1,376 @@
+"""
+Every query the bot runs, grouped by what it stores.
+
+The repositories work with whichever backend ``db`` picked; SQL that
+differs between MySQL and SQLite comes from ``db.dialect``. All methods
+raise DatabaseError when the database fails.
+"""
+import time
+
+from utils.database import db
+from utils.gear_history import week_of
+
+MEMBER_COLUMNS = ("discord_id", "guild_id", "ingame_name", "gear_score", "class", "main_hand", "offhand")
+REPLACE_MEMBER = (
+    f"REPLACE INTO guild_members ({', '.join(MEMBER_COLUMNS)}) "
+    f"VALUES ({', '.join(['%s'] * len(MEMBER_COLUMNS))})"
+)
+
+
+class GuildMemberRepository:
+    async def upsert_many(self, members, batch_size=500):
+        """
+        Insert or replace members in a single transaction, ``batch_size`` rows
+        per statement, and append every gear score change to the history.
+        Returns the rows they replaced keyed by ``(discord_id, guild_id)``.
+        """
+        by_guild = {}
+        for member in members:
+            by_guild.setdefault(member['guild_id'], []).append(member)
+        rows = [tuple(member[column] for column in MEMBER_COLUMNS) for member in members]
+        recorded_at = int(time.time() * 1000)
+        week = week_of(recorded_at / 1000)
+
+        def _upsert(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                previous = {}
+                events = []
+                for guild_id, guild_members in by_guild.items():
+                    for start in range(0, len(guild_members), batch_size):
+                        batch = guild_members[start:start + batch_size]
+                        placeholders = ', '.join(['%s'] * len(batch))
+                        ids = tuple(member['discord_id'] for member in batch)
+                        cursor.execute(
+                            f"SELECT * FROM guild_members WHERE guild_id = %s AND discord_id IN ({placeholders})"
+                            + db.dialect.for_update,
+                            (guild_id, *ids)
+                        )
+                        for row in cursor.fetchall():
+                            previous[(row['discord_id'], row['guild_id'])] = row
+                        # Deltas are taken against the history itself, so it stays consistent
+                        # for members who left and came back. A locking read sees the latest sum.
+                        cursor.execute(
+                            "SELECT discord_id, SUM(delta) AS score FROM gear_score_events "
+                            f"WHERE guild_id = %s AND discord_id IN ({placeholders}) GROUP BY discord_id"
+                            + db.dialect.for_update,
+                            (guild_id, *ids)
+                        )
+                        history = {row['discord_id']: int(row['score']) for row in cursor.fetchall()}
+                        for member in batch:
+                            delta = member['gear_score'] - history.get(member['discord_id'], 0)
+                            if delta:
+                                events.append((guild_id, week, member['discord_id'], recorded_at, delta))
+                for start in range(0, len(rows), batch_size):
+                    cursor.executemany(REPLACE_MEMBER, rows[start:start + batch_size])
+                if events:
+                    cursor.executemany(
+                        "INSERT INTO gear_score_events (guild_id, week, discord_id, recorded_at, delta) VALUES (%s, %s, %s, %s, %s)",
+                        events
+                    )
+                # All or nothing: a failure above rolls the whole batch back
+                connection.commit()
+                return previous
+            finally:
+                cursor.close()
+        return await db.run(_upsert)
+
+    async def delete_by_name(self, guild_id, ingame_name):
+        """Delete every row with this in-game name in the guild and return the deleted rows."""
+        def _delete(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(
+                    "SELECT * FROM guild_members WHERE ingame_name = %s AND guild_id = %s" + db.dialect.for_update,
+                    (ingame_name, guild_id)
+                )
+                rows = cursor.fetchall()
+                if rows:
+                    cursor.execute("DELETE FROM guild_members WHERE ingame_name = %s AND guild_id = %s", (ingame_name, guild_id))
+                connection.commit()
+                return rows
+            finally:
+                cursor.close()
+        return await db.run(_delete)
+
+    async def delete_many(self, guild_id, discord_ids, batch_size=500):
+        """
+        Delete the guild's rows for these Discord IDs in a single transaction,
+        ``batch_size`` IDs per ``IN`` list. Returns the deleted rows.
+        """
+        discord_ids = list(discord_ids)
+
+        def _delete(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                deleted = []
+                for start in range(0, len(discord_ids), batch_size):
+                    batch = discord_ids[start:start + batch_size]
+                    where = f"WHERE guild_id = %s AND discord_id IN ({', '.join(['%s'] * len(batch))})"
+                    # Read the rows first so the stats can subtract exactly what was removed
+                    cursor.execute(f"SELECT * FROM guild_members {where}" + db.dialect.for_update, (guild_id, *batch))
+                    rows = cursor.fetchall()
+                    if rows:
+                        cursor.execute(f"DELETE FROM guild_members {where}", (guild_id, *batch))
+                        deleted.extend(rows)
+                connection.commit()
+                return deleted
+            finally:
+                cursor.close()
+        return await db.run(_delete)
+
+    async def member_ids(self, guild_id):
+        """The set of Discord IDs with a row in the guild."""
+        rows = await db.fetchall("SELECT discord_id FROM guild_members WHERE guild_id = %s", (guild_id,), dictionary=False)
+        return {row[0] for row in rows}
+
+    async def count(self, guild_id):
+        row = await db.fetchone("SELECT COUNT(*) FROM guild_members WHERE guild_id = %s", (guild_id,), dictionary=False)
+        return row[0]
+
+    async def page(self, guild_id, cursor, backwards, size):
+        """
+        Up to ``size`` members by gear score (highest first), starting after
+        ``cursor`` or ending before it when ``backwards``. See roster.fetch_page.
+        """
+        if cursor is None:
+            query = (
+                "SELECT * FROM guild_members WHERE guild_id = %s "
+                "ORDER BY gear_score DESC, discord_id ASC LIMIT %s"
+            )
+            params = (guild_id, size)
+        elif not backwards:
+            query = (
+                "SELECT * FROM guild_members WHERE guild_id = %s "
+                "AND (gear_score < %s OR (gear_score = %s AND discord_id > %s)) "
+                "ORDER BY gear_score DESC, discord_id ASC LIMIT %s"
+            )
+            params = (guild_id, cursor[0], cursor[0], cursor[1], size)
+        else:
+            query = (
+                "SELECT * FROM guild_members WHERE guild_id = %s "
+                "AND (gear_score > %s OR (gear_score = %s AND discord_id < %s)) "
+                "ORDER BY gear_score ASC, discord_id DESC LIMIT %s"
+            )
+            params = (guild_id, cursor[0], cursor[0], cursor[1], size)
+        page = await db.fetchall(query, params)
+        if backwards:
+            page.reverse()
+        return page
+
+    async def aggregate(self, guild_id):
+        """Member count and gear total, counts per class and per weapon pair: (totals, classes, combos)."""
+        def _aggregate(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(
+                    "SELECT COUNT(*) AS count, COALESCE(SUM(gear_score), 0) AS gear_total "
+                    "FROM guild_members WHERE guild_id = %s", (guild_id,)
+                )
+                totals = cursor.fetchone()
+                cursor.execute(
+                    "SELECT class, COUNT(*) AS count FROM guild_members WHERE guild_id = %s GROUP BY class", (guild_id,)
+                )
+                classes = cursor.fetchall()
+                cursor.execute(
+                    "SELECT main_hand, offhand, COUNT(*) AS count FROM guild_members "
+                    "WHERE guild_id = %s GROUP BY main_hand, offhand", (guild_id,)
+                )
+                combos = cursor.fetchall()
+                return totals, classes, combos
+            finally:
+                cursor.close()
+        return await db.run_read(_aggregate)
+
+
+class GuildSettingsRepository:
+    async def all(self):
+        return await db.fetchall("SELECT guild_id, channel_id, role_id, lead_minutes FROM guild_settings")
+
+    async def save(self, guild_id, channel_id, role_id, lead_minutes):
+        await db.execute(
+            "REPLACE INTO guild_settings (guild_id, channel_id, role_id, lead_minutes) VALUES (%s, %s, %s, %s)",
+            (guild_id, channel_id, role_id, lead_minutes)
+        )
+
+
+class WelcomeMessageRepository:
+    async def all(self):
+        """Every guild's welcome message keyed by guild ID."""
+        rows = await db.fetchall("SELECT guild_id, message FROM welcome_messages")
+        return {row['guild_id']: row['message'] for row in rows}
+
+    async def get(self, guild_id):
+        row = await db.fetchone("SELECT message FROM welcome_messages WHERE guild_id = %s", (guild_id,), dictionary=False)
+        return row[0] if row else None
+
+    async def save(self, guild_id, message):
+        """Insert or update the guild's message and return the affected row count."""
+        return await db.execute(
+            db.dialect.upsert("welcome_messages", ("guild_id", "message"), ("guild_id",)),
+            (guild_id, message)
+        )
+
+
+class ArchbossRepository:
+    async def cycle(self):
+        """The rotation's states in order from the archboss_cycle table, empty if it hasn't been filled in."""
+        rows = await db.fetchall("SELECT cycle_state FROM archboss_cycle ORDER BY id")
+        return [row['cycle_state'] for row in rows]
+
+    async def load(self):
+        """The stored anchor as ``(anchor_timestamp, state, position)``, or None. ``position`` may be None."""
+        row = await db.fetchone("SELECT anchor_time, cycle_state, cycle_position FROM archboss_anchor WHERE id = 1")
+        return (row['anchor_time'], row['cycle_state'], row['cycle_position']) if row else None
+
+    async def save(self, anchor_timestamp, state, position):
+        await db.execute(
+            "REPLACE INTO archboss_anchor (id, anchor_time, cycle_state, cycle_position) VALUES (1, %s, %s, %s)",
+            (anchor_timestamp, state, position)
+        )
+
+
+class VoteRepository:
+    """Drop posts with their reaction votes, and weekly boss vote posts with their ballots."""
+
+    async def recent_drop_posts(self, days):
+        """Posts from the last ``days`` days and their votes: (posts, votes)."""
+        def _load(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(
+                    f"SELECT message_id, guild_id, items FROM drop_posts WHERE created_at >= {db.dialect.days_ago()}",
+                    (days,)
+                )
+                posts = cursor.fetchall()
+                cursor.execute(
+                    "SELECT v.message_id, v.item_index, v.user_id FROM drop_votes v "
+                    "JOIN drop_posts p ON p.message_id = v.message_id "
+                    f"WHERE p.created_at >= {db.dialect.days_ago()}",
+                    (days,)
+                )
+                return posts, cursor.fetchall()
+            finally:
+                cursor.close()
+        return await db.run_read(_load)
+
+    async def drop_post(self, message_id):
+        """A single post's guild, items (JSON) and votes: (guild_id, items, votes), or None if it isn't a drop post."""
+        post = await db.fetchone("SELECT guild_id, items FROM drop_posts WHERE message_id = %s", (message_id,))
+        if not post:
+            return None
+        votes = await db.fetchall("SELECT item_index, user_id FROM drop_votes WHERE message_id = %s", (message_id,))
+        return post['guild_id'], post['items'], votes
+
+    async def add_drop_post(self, message_id, guild_id, channel_id, items):
+        await db.execute(
+            "INSERT INTO drop_posts (message_id, guild_id, channel_id, items) VALUES (%s, %s, %s, %s)",
+            (message_id, guild_id, channel_id, items)
+        )
+
+    async def add_drop_vote(self, message_id, item_index, user_id):
+        await db.execute(
+            f"{db.dialect.insert_ignore} INTO drop_votes (message_id, item_index, user_id) VALUES (%s, %s, %s)",
+            (message_id, item_index, user_id)
+        )
+
+    async def remove_drop_vote(self, message_id, item_index, user_id):
+        await db.execute(
+            "DELETE FROM drop_votes WHERE message_id = %s AND item_index = %s AND user_id = %s",
+            (message_id, item_index, user_id)
+        )
+
+    async def recent_boss_posts(self, days):
+        """Weekly boss posts from the last ``days`` days and their ballots: (posts, votes)."""
+        def _load(connection):
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(
+                    f"SELECT message_id, guild_id FROM boss_vote_posts WHERE created_at >= {db.dialect.days_ago()}",
+                    (days,)
+                )
+                posts = cursor.fetchall()
+                cursor.execute(
+                    "SELECT v.message_id, v.user_id, v.boss FROM boss_votes v "
+                    "JOIN boss_vote_posts p ON p.message_id = v.message_id "
+                    f"WHERE p.created_at >= {db.dialect.days_ago()}",
+                    (days,)
+                )
+                return posts, cursor.fetchall()
+            finally:
+                cursor.close()
+        return await db.run_read(_load)
+
+    async def boss_post(self, message_id):
+        """A single post's guild and ballots as rows of (user_id, boss): (guild_id, votes), or None if it isn't a vote post."""
+        post = await db.fetchone("SELECT guild_id FROM boss_vote_posts WHERE message_id = %s", (message_id,))
+        if not post:
+            return None
+        votes = await db.fetchall("SELECT user_id, boss FROM boss_votes WHERE message_id = %s", (message_id,))
+        return post['guild_id'], votes
+
+    async def add_boss_post(self, message_id, guild_id):
+        await db.execute(
+            "INSERT INTO boss_vote_posts (message_id, guild_id) VALUES (%s, %s)",
+            (message_id, guild_id)
+        )
+
+    async def replace_boss_ballot(self, message_id, user_id, bosses):
+        """Replace a user's ballot on a post in one transaction, an empty ``bosses`` clears it."""
+        def _save(connection):
+            cursor = connection.cursor()
+            try:
+                cursor.execute("DELETE FROM boss_votes WHERE message_id = %s AND user_id = %s", (message_id, user_id))
+                if bosses:
+                    cursor.executemany(
+                        "INSERT INTO boss_votes (message_id, user_id, boss) VALUES (%s, %s, %s)",
+                        [(message_id, user_id, boss) for boss in bosses]
+                    )
+                connection.commit()
+            finally:
+                cursor.close()
+        await db.run(_save)
+
+
+class GearHistoryRepository:
+    """Gear score change events and the weekly guild aggregates rolled up from the roster."""
+
+    async def member_events(self, guild_id, discord_id):
+        """A member's ``(recorded_at, delta)`` events in the guild, oldest first."""
+        rows = await db.fetchall(
+            "SELECT recorded_at, delta FROM gear_score_events WHERE guild_id = %s AND discord_id = %s "
+            "ORDER BY recorded_at",
+            (guild_id, discord_id), dictionary=False
+        )
+        return [(recorded_at, delta) for recorded_at, delta in rows]
+
+    async def weekly(self, guild_id, since_week):
+        return await db.fetchall(
+            "SELECT week, members, average, median, top_decile FROM gear_score_weekly "
+            "WHERE guild_id = %s AND week >= %s ORDER BY week",
+            (guild_id, since_week)
+        )
+
+    async def roster_scores(self):
+        """Every guild's current gear scores as rows of (guild_id, gear_score)."""
+        return await db.fetchall(
+            "SELECT guild_id, gear_score FROM guild_members WHERE gear_score IS NOT NULL", dictionary=False
+        )
+
+    async def save_weekly(self, rows):
+        """Insert or update ``(guild_id, week, members, average, median, top_decile)`` rows."""
+        await db.executemany(
+            db.dialect.upsert(
+                "gear_score_weekly", ("guild_id", "week", "members", "average", "median", "top_decile"), ("guild_id", "week")
+            ),
+            rows
+        )
+
+
+# The shared repositories every cog should use
+member_repo = GuildMemberRepository()
+settings_repo = GuildSettingsRepository()
+welcome_repo = WelcomeMessageRepository()
+archboss_repo = ArchbossRepository()
+vote_repo = VoteRepository()
+gear_repo = GearHistoryRepository()
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from utils.database import DatabaseError
+from utils.guild_stats import guild_stats
+from utils.repositories import member_repo
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 10
+
+# Buffered /add_member writes are flushed this often, or once this many are waiting
+FLUSH_INTERVAL = 5
+MAX_PENDING_WRITES = 200
+
+VALID_WEAPONS = [
+    "Staff", "Dagger", "SwordAndShield", "Greatsword", "Long Bow", "Crossbow", "WandAndTome"
+]
+VALID_CLASSES = ["Healer", "DPS", "Tank"]
+
+
+class RosterPageCache:
+    """
+    Small per-guild LRU cache of roster pages.
+
+    Pages are keyed by the keyset cursor they start from, so two people
+    paging through the same guild share the queries. Any write to a guild's
+    roster must call :meth:`invalidate`.
+    """
+
+    def __init__(self, pages_per_guild=8):
+        self.pages_per_guild = pages_per_guild
+        self._pages = {}
+        self._counts = {}
+
+    def get(self, guild_id, key):
+        pages = self._pages.get(guild_id)
+        if pages is None or key not in pages:
+            return None
+        pages.move_to_end(key)
+        return pages[key]
+
+    def put(self, guild_id, key, page):
+        pages = self._pages.setdefault(guild_id, OrderedDict())
+        pages[key] = page
+        pages.move_to_end(key)
+        while len(pages) > self.pages_per_guild:
+            pages.popitem(last=False)
+
+    def get_count(self, guild_id):
+        return self._counts.get(guild_id)
+
+    def put_count(self, guild_id, count):
+        self._counts[guild_id] = count
+
+    def invalidate(self, guild_id):
+        self._pages.pop(guild_id, None)
+        self._counts.pop(guild_id, None)
+
+
+roster_cache = RosterPageCache()
+
+
+class MemberWriteBuffer:
+    """
+    Write-behind buffer for single-member updates.
+
+    Only the latest row per ``(discord_id, guild_id)`` is kept, so someone
+    re-running /add_member a few times in a row costs one write. Pending rows
+    are written in one transaction by :meth:`flush`, which the roster cog
+    calls every FLUSH_INTERVAL seconds and on unload; reaching ``max_pending``
+    flushes straight away. Every roster read flushes the guild's pending rows
+    first, so reads always see them.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_WRITES):
+        self.max_pending = max_pending
+        self.coalesced = 0  # Writes replaced by a newer one before reaching the database
+        self._pending = {}
+        # Rows a running flush took out of _pending but hasn't committed yet
+        self._inflight = {}
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, member):
+        key = (member['discord_id'], member['guild_id'])
+        if key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = member
+        if len(self._pending) >= self.max_pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_in_background())
+
+    def has_pending(self, guild_id=None):
+        # In-flight rows count, so a read waits for the running flush instead of reading around it
+        return any(guild_id is None or key[1] == guild_id for key in (*self._pending, *self._inflight))
+
+    async def flush(self, guild_id=None):
+        """
+        Write the pending rows, only the guild's if ``guild_id`` is given, and
+        return how many were written. Raises DatabaseError if the write fails;
+        the rows stay pending unless a newer one arrived meanwhile.
+        """
+        if not self.has_pending(guild_id):
+            return 0
+        async with self._lock:
+            batch = {key: member for key, member in self._pending.items() if guild_id is None or key[1] == guild_id}
+            if not batch:
+                # Another flush wrote this guild's rows while we waited for the lock
+                return 0
+            for key in batch:
+                del self._pending[key]
+            self._inflight = batch
+            try:
+                try:
+                    previous = await member_repo.upsert_many(list(batch.values()))
+                except DatabaseError:
+                    for key, member in batch.items():
+                        self._pending.setdefault(key, member)
+                    raise
+                for key, member in batch.items():
+                    guild_stats.record_upsert(key[1], previous.get(key), member)
+                for flushed_guild in {key[1] for key in batch}:
+                    roster_cache.invalidate(flushed_guild)
+                return len(batch)
+            finally:
+                self._inflight = {}
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush()
+        except DatabaseError as e:
+            logger.error(f"Failed to flush {len(self)} buffered member updates: {e}")
+
+
+# Kept here rather than in the cog so pending rows survive a reload of the roster cog
+member_buffer = MemberWriteBuffer()
+
+
+async def count_members(guild_id):
+    await member_buffer.flush(guild_id)
+    count = roster_cache.get_count(guild_id)
+    if count is None:
+        count = await member_repo.count(guild_id)
+        roster_cache.put_count(guild_id, count)
+    return count
+
+
+async def fetch_page(guild_id, cursor=None, backwards=False, size=PAGE_SIZE):
+    """
+    Return up to ``size`` members ordered by gear score (highest first).
+
+    ``cursor`` is the ``(gear_score, discord_id)`` of the row the page starts
+    after, or ends before when ``backwards`` is set. Rows are found through
+    the guild's index rather than by skipping an OFFSET, so every page costs
+    the same no matter how deep into the roster it is.
+    """
+    await member_buffer.flush(guild_id)
+    key = (cursor, backwards, size)
+    page = roster_cache.get(guild_id, key)
+    if page is not None:
+        return page
+
+    page = await member_repo.page(guild_id, cursor, backwards, size)
+    roster_cache.put(guild_id, key, page)
+    return page
+
+
+async def iter_members(guild_id, batch_size=500):
+    """
+    Yield the whole roster in gear score order, ``batch_size`` rows at a time.
+
+    Each batch is a keyset query starting after the last row of the previous
+    one, so only one batch is held in memory. Bypasses the page cache.
+    """
+    await member_buffer.flush(guild_id)
+    cursor = None
+    while True:
+        batch = await member_repo.page(guild_id, cursor, False, batch_size)
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        cursor = cursor_of(batch[-1])
+
+
+def cursor_of(member):
+    return (member['gear_score'], member['discord_id'])
@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+import tempfile
+
+from utils.roster import VALID_CLASSES, VALID_WEAPONS, iter_members
+
+# Column order of exported files; an export can be imported again unchanged
+COLUMNS = ("discord_id", "ingame_name", "gear_score", "class", "main_hand", "offhand")
+
+# Exports larger than this spill from memory to a temporary file
+SPOOL_BYTES = 1024 * 1024
+
+
+class RosterFileError(Exception):
+    """The uploaded file could not be read as a roster at all."""
+
+
+def read_rows(data, filename):
+    """
+    Decode an uploaded CSV or JSON roster into dicts, picked by file extension.
+
+    CSV needs a header row with the COLUMNS; JSON a list of objects with
+    those keys. Raises RosterFileError if the file can't be parsed.
+    """
+    try:
+        text = data.decode("utf-8-sig")  # Spreadsheets like to prepend a BOM
+    except UnicodeDecodeError:
+        raise RosterFileError("The file is not UTF-8 text.")
+
+    if filename.lower().endswith(".json"):
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise RosterFileError(f"Invalid JSON: {e}")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise RosterFileError("The JSON file must contain a list of objects.")
+        return rows
+
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text))
+        missing = [column for column in COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise RosterFileError(f"Missing CSV columns: {', '.join(missing)}")
+        return list(reader)
+
+    raise RosterFileError("Please upload a .csv or .json file.")
+
+
+def validate_rows(rows, guild_id):
+    """
+    Check every row in a single pass.
+
+    Returns ``(members, errors)``: the rows as guild_members dicts ready to be
+    written, and one message per invalid entry. Entries are numbered from 1,
+    not counting the CSV header.
+    """
+    members = []
+    errors = []
+    seen = {}
+    for number, row in enumerate(rows, start=1):
+        problems = []
+        try:
+            discord_id = int(str(row.get("discord_id", "")).strip())
+            if discord_id <= 0:
+                raise ValueError
+        except ValueError:
+            problems.append("discord_id must be a Discord user ID")
+            discord_id = None
+        try:
+            gear_score = int(str(row.get("gear_score", "")).strip())
+            if gear_score < 0:
+                raise ValueError
+        except ValueError:
+            problems.append("gear_score must be a whole number")
+            gear_score = None
+        ingame_name = str(row.get("ingame_name") or "").strip()
+        if not ingame_name or len(ingame_name) > 255:
+            problems.append("ingame_name must be 1-255 characters")
+        guild_class = str(row.get("class") or "").strip()
+        if guild_class not in VALID_CLASSES:
+            problems.append(f"class must be one of {', '.join(VALID_CLASSES)}")
+        main_hand = str(row.get("main_hand") or "").strip()
+        offhand = str(row.get("offhand") or "").strip()
+        for column, weapon in (("main_hand", main_hand), ("offhand", offhand)):
+            if weapon not in VALID_WEAPONS:
+                problems.append(f"{column} '{weapon}' is not a valid weapon")
+        if discord_id is not None:
+            if discord_id in seen:
+                problems.append(f"discord_id {discord_id} is already used on entry {seen[discord_id]}")
+            else:
+                seen[discord_id] = number
+
+        if problems:
+            errors.append(f"Entry {number}: {'; '.join(problems)}")
+            continue
+        members.append({
+            'discord_id': discord_id,
+            'guild_id': guild_id,
+            'ingame_name': ingame_name,
+            'gear_score': gear_score,
+            'class': guild_class,
+            'main_hand': main_hand,
+            'offhand': offhand
+        })
+    return members, errors
+
+
+async def write_roster_file(guild_id, fmt="csv", batch_size=500):
+    """
+    Write the guild's roster to a file object positioned at the start.
+
+    Rows are streamed from the database in keyset batches into a spooled
+    temporary file, so a large guild never sits in memory as a whole.
+    Returns ``(file, row_count)``; the caller closes the file.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode="w+b")
+    text = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+    count = 0
+    try:
+        if fmt == "json":
+            text.write("[")
+            async for batch in iter_members(guild_id, batch_size):
+                for member in batch:
+                    text.write(",\n" if count else "\n")
+                    text.write(json.dumps({column: member[column] for column in COLUMNS}))
+                    count += 1
+            text.write("\n]\n")
+        else:
+            writer = csv.writer(text)
+            writer.writerow(COLUMNS)
+            async for batch in iter_members(guild_id, batch_size):
+                writer.writerows([member[column] for column in COLUMNS] for member in batch)
+                count += len(batch)
+    except BaseException:
+        spool.close()
+        raise
+    text.flush()
+    text.detach()  # Leave the spooled file open for the caller
+    spool.seek(0)
+    return spool, count
@@ -0,0 +1,106 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class ScheduledEvent:
+    """An entry in the scheduler's queue. ``payload`` is whatever the caller attached."""
+
+    __slots__ = ("fire_at", "seq", "key", "payload", "cancelled")
+
+    def __init__(self, fire_at, seq, key, payload):
+        self.fire_at = fire_at
+        self.seq = seq
+        self.key = key
+        self.payload = payload
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.fire_at, self.seq) < (other.fire_at, other.seq)
+
+
+class EventScheduler:
+    """
+    Priority queue of one-shot events keyed by an arbitrary hashable ``key``.
+
+    Scheduling a key again replaces its previous event, and cancelled events
+    are dropped lazily when they reach the top of the heap. :meth:`wait_due`
+    sleeps exactly until the earliest event is due, or until an earlier one
+    is scheduled, so nothing wakes up while there is nothing to do.
+
+    ``clock`` returns the current time as a UNIX timestamp and can be replaced
+    in tests; :meth:`pop_due` accepts an explicit ``now`` for the same reason.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._heap = []
+        self._events = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._events)
+
+    def __contains__(self, key):
+        return key in self._events
+
+    def schedule(self, key, fire_at, payload=None):
+        """Schedule ``key`` to fire at the UNIX timestamp ``fire_at``, replacing any earlier entry."""
+        self.cancel(key)
+        event = ScheduledEvent(fire_at, next(self._counter), key, payload)
+        self._events[key] = event
+        heapq.heappush(self._heap, event)
+        if self._heap[0] is event:
+            # The new event is now the earliest one, so the waiter must recompute its sleep
+            self._wakeup.set()
+        return event
+
+    def cancel(self, key):
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.cancelled = True
+
+    def cancel_where(self, predicate):
+        for key in [key for key in self._events if predicate(key)]:
+            self.cancel(key)
+
+    def clear(self):
+        self._heap.clear()
+        self._events.clear()
+        self._wakeup.set()
+
+    def next_fire_time(self):
+        """Return the timestamp of the earliest pending event, or None if the queue is empty."""
+        while self._heap and self._heap[0].cancelled:
+            heapq.heappop(self._heap)
+        return self._heap[0].fire_at if self._heap else None
+
+    def pop_due(self, now=None):
+        """Remove and return every event due at ``now``, earliest first."""
+        now = self.clock() if now is None else now
+        due = []
+        while True:
+            fire_at = self.next_fire_time()
+            if fire_at is None or fire_at > now:
+                return due
+            event = heapq.heappop(self._heap)
+            del self._events[event.key]
+            due.append(event)
+
+    async def wait_due(self):
+        """Sleep until at least one event is due and return all due events."""
+        while True:
+            self._wakeup.clear()
+            fire_at = self.next_fire_time()
+            if fire_at is not None:
+                delay = fire_at - self.clock()
+                if delay <= 0:
+                    return self.pop_due()
+            else:
+                delay = None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
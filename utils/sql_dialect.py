@@ -0,0 +1,49 @@
+class MySQLDialect:
+    """The bits of SQL that differ between backends, MySQL flavour. Placeholders are always ``%s``."""
+
+    name = "mysql"
+    insert_ignore = "INSERT IGNORE"
+    # Appended to a SELECT that reads rows it is about to replace
+    for_update = " FOR UPDATE"
+
+    def upsert(self, table, columns, keys):
+        """INSERT that updates the non-key columns when a row with the same keys exists."""
+        updates = ", ".join(f"{column} = VALUES({column})" for column in columns if column not in keys)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+
+    def days_ago(self):
+        """Expression for "now minus %s days", comparable with TIMESTAMP columns."""
+        return "NOW() - INTERVAL %s DAY"
+
+    def table_exists(self):
+        return "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s"
+
+
+class SQLiteDialect(MySQLDialect):
+    """SQLite flavour. The SQLite backend rewrites ``%s`` placeholders to ``?``."""
+
+    name = "sqlite"
+    insert_ignore = "INSERT OR IGNORE"
+    # There is a single writer, so nothing else can change the rows in between
+    for_update = ""
+
+    def upsert(self, table, columns, keys):
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column not in keys)
+        return (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+        )
+
+    def days_ago(self):
+        # CURRENT_TIMESTAMP columns hold 'YYYY-MM-DD HH:MM:SS' text in UTC, which datetime() matches
+        return "datetime('now', '-' || %s || ' days')"
+
+    def table_exists(self):
+        return "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s"
+
+
+MYSQL = MySQLDialect()
+SQLITE = SQLiteDialect()
@@ -0,0 +1,200 @@
+import asyncio
+import bisect
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, shared by every histogram so they can be compared directly
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, the same shape Prometheus uses."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation, an estimate good to one bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class Span:
+    """Time spent in one handler invocation, split into database and Discord API time."""
+
+    def __init__(self, kind, name, parent):
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.db = 0.0
+        self.api = 0.0
+
+
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class Telemetry:
+    """
+    Latency histograms per handler: prefix commands, app commands, event
+    listeners and background tasks.
+
+    A handler is timed with ``track``, which makes its Span current for the
+    running task. The database layer and the wrapped Discord HTTP client add
+    the time they spend to the current span (and any span it is nested in),
+    so each invocation records wall, DB and API time.
+    """
+
+    def __init__(self):
+        self.histograms = {}  # (kind, name, part) -> Histogram
+        self._runner = None
+
+    def histogram(self, kind, name, part):
+        key = (kind, name, part)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    @contextmanager
+    def track(self, kind, name=None):
+        span = Span(kind, name, _current_span.get())
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            wall = time.perf_counter() - start
+            _current_span.reset(token)
+            # The name may only be known once the handler has run
+            name = span.name or "unknown"
+            self.histogram(kind, name, "wall").observe(wall)
+            self.histogram(kind, name, "db").observe(span.db)
+            self.histogram(kind, name, "api").observe(span.api)
+
+    def timed(self, kind, name=None):
+        """Decorator form of ``track`` for coroutine functions, e.g. task loop bodies."""
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.track(kind, name or func.__name__):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def add(part, seconds):
+        span = _current_span.get()
+        while span is not None:
+            setattr(span, part, getattr(span, part) + seconds)
+            span = span.parent
+
+    def instrument_http(self, http):
+        """Wrap the bot's HTTP client so every Discord API call counts towards the current span."""
+        if getattr(http.request, "_telemetry", False):
+            return
+        request = http.request
+
+        @wraps(request)
+        async def timed_request(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await request(*args, **kwargs)
+            finally:
+                self.add("api", time.perf_counter() - start)
+
+        timed_request._telemetry = True
+        http.request = timed_request
+
+    def summary(self, limit=10):
+        """Handlers with the highest P95 wall time: (kind, name, count, p50, p95, db mean, api mean)."""
+        rows = []
+        for (kind, name, part), wall in self.histograms.items():
+            if part != "wall":
+                continue
+            rows.append((
+                kind, name, wall.count, wall.quantile(0.50), wall.quantile(0.95),
+                self.histograms[(kind, name, "db")].mean, self.histograms[(kind, name, "api")].mean,
+            ))
+        rows.sort(key=lambda row: row[4], reverse=True)
+        return rows[:limit]
+
+    def render(self):
+        """All histograms in the Prometheus text exposition format."""
+        lines = [
+            "# HELP voidling_handler_seconds Time spent per handler invocation, split into wall, database and Discord API time.",
+            "# TYPE voidling_handler_seconds histogram",
+        ]
+        for (kind, name, part), histogram in sorted(self.histograms.items()):
+            labels = f'kind="{kind}",name="{name}",part="{part}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'voidling_handler_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'voidling_handler_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"voidling_handler_seconds_sum{{{labels}}} {histogram.total}")
+            lines.append(f"voidling_handler_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    async def write_file(self, path):
+        """Write the Prometheus text to ``path`` for a node exporter textfile collector."""
+        text = self.render()
+
+        def _write():
+            # Write then rename so a scraper never reads a half-written file
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(text)
+            os.replace(temp_path, path)
+
+        # run_in_executor rather than asyncio.to_thread, which needs Python 3.9
+        await asyncio.get_running_loop().run_in_executor(None, _write)
+
+    async def serve(self, host, port):
+        """
+        Serve ``/metrics`` over HTTP.
+
+        The server lives for the rest of the process, calling this again
+        (e.g. after a cog reload) is a no-op.
+        """
+        if self._runner is not None:
+            return
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        self._runner = runner
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+telemetry = Telemetry()